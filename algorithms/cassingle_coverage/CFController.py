@@ -3,27 +3,41 @@
 from pycrazyswarm import *
 import numpy as np
 import math
-import json
-from scipy.spatial.transform import Rotation
-
-def print2txt(txt):
-    with open("origin.txt", "w") as f:
-        f.write(txt)
-
+import time
+from algorithms.cassingle_coverage.telemetry import TelemetryLogger
+from algorithms.fleetState import FleetState
 
 class CFController:
-    def __init__(self, allCrazyFlies, N, T, Z, actualSpeed):
-        self.executeNumber = 0
+    # allCrazyFlies为FleetState或crazyfiles.yaml中的列表，logPath为遥测日志文件，用telemetry.loadTelemetry读取
+    def __init__(self, allCrazyFlies, N, T, Z, actualSpeed, logPath="origin.bin"):
         self.actualSpeed = actualSpeed
         self.cfNum = len(allCrazyFlies)
-        self.logBuffer = []
         # height
         self.Z = Z
         self.framRate = float(N) / T
-        names = self.__dict__
 
-        for cf in allCrazyFlies:
-            names['lastYaw'+str(cf['Id'])] = 0.0
+        # 无人机Id到数组行号的映射，所有状态按行号保存
+        if isinstance(allCrazyFlies, FleetState):
+            self.IdList = list(allCrazyFlies.IdList)
+        else:
+            self.IdList = [cf['Id'] for cf in allCrazyFlies]
+        self.IdArray = np.array(self.IdList)
+        self.rows = {Id: row for row, Id in enumerate(self.IdList)}
+        self.yaws = np.zeros(self.cfNum)
+        # 每个周期读取的实际位置，以及上一次下发的指令(vx, vy, vz, yawRate)
+        self.actualPositions = np.zeros((self.cfNum, 3))
+        self.lastCommands = np.zeros((self.cfNum, 4))
+
+        # 遥测日志由后台线程写入，每个周期的计算和下发耗时只统计总和与最大值
+        self.logger = TelemetryLogger(logPath)
+        self.costSum = 0.
+        self.costMax = 0.
+
+        # 固定频率下发指令，记录下一个周期的截止时刻和超时次数
+        self.period = 1.0 / self.framRate
+        self.nextTick = None
+        self.tickNum = 0
+        self.deadlineMisses = 0
 
     def startFlies(self):
         print('Start flying!')
@@ -32,70 +46,97 @@ class CFController:
         swarm = Crazyswarm()
         self.timeHelper = swarm.timeHelper
         self.allcfs = swarm.allcfs
+        allcfsDict = self.allcfs.crazyfliesById
+        self.cfs = [allcfsDict[Id] for Id in self.IdList]
 
         # 所有无人机同时起飞
         self.allcfs.takeoff(targetHeight=self.Z, duration=1.0)
         # 等待2秒
         self.timeHelper.sleep(2.0)
 
-    # 按照轨迹进行巡航
+    # 按照轨迹进行巡航，同一时间索引的航点在同一个周期内下发
     def goWaypoints(self, waypoints):
-        kPosition = 1.
-        # 获取无人机字典
-        allcfsDict = self.allcfs.crazyfliesById
-
+        indexList = sorted(set(waypoint['index'] for waypoint in waypoints))
+        tickRows = {index: tick for tick, index in enumerate(indexList)}
+
+        # 整理为(时刻, 无人机)的数组，没有航点的无人机在该时刻不下发指令
+        shape = (len(indexList), self.cfNum)
+        Px = np.zeros(shape)
+        Py = np.zeros(shape)
+        theta = np.zeros(shape)
+        valid = np.zeros(shape, dtype=bool)
         for waypoint in waypoints:
-            # 取出实际位置和速度
-            vx = self.actualSpeed * np.cos(waypoint['theta'])
-            vy = self.actualSpeed * np.sin(waypoint['theta'])
-            desiredPos = np.array([waypoint['Px'], waypoint['Py'], self.Z])
-
-            # 获取对应ID的无人机控制器实例
-            cf = allcfsDict[waypoint['Id']]
-
-            actualPosition = cf.position()
-            quaternion = cf.quaternion()
-
-            rot = Rotation.from_quat(quaternion)
-            actualPose = rot.as_euler("xyz")
-            error = desiredPos - actualPosition
-
-            self.logBuffer.append({
-                "id": waypoint["Id"],
-                "position": actualPosition.tolist()
-            })
-
-            # yawError = (waypoint['theta'] - actualPose[2]) / math.pi * 180
-            # if (yawError >= 180):
-            #     yawError  = 360 - yawError
-            # elif(yawError <= -180):
-            #     yawError += -yawError - 360
-
-            # yawRate = - round(yawError, 2)
-
-            exec("yawError = (waypoint['theta'] - self.lastYaw{}) / math.pi * 180".format(waypoint['Id']))
-
-            if (yawError >= 180):
-                yawError  = 360 - yawError
-            elif(yawError <= -180):
-                yawError += -yawError - 360
-
-            exec("yawRate = (waypoint['theta'] - self.lastYaw{}) / math.pi * 180 * self.framRate".format(waypoint['Id']))
-
-            exec("self.lastYaw{} = waypoint['theta']".format(waypoint['Id']))
-            cf.cmdVelocityWorld(np.array([vx, vy, 0] + kPosition * error), yawRate = -yawError * self.framRate)
-            #cf.cmdVelocityWorld(np.array([vx, vy, 0] + kPosition * error), yawRate = 0)
-
-            self.executeNumber += 1
-            if(self.executeNumber == self.cfNum):
-                self.timeHelper.sleepForRate(self.framRate)
-                self.executeNumber = 0
+            tick, row = tickRows[waypoint['index']], self.rows[waypoint['Id']]
+            Px[tick, row] = waypoint['Px']
+            Py[tick, row] = waypoint['Py']
+            theta[tick, row] = waypoint['theta']
+            valid[tick, row] = True
+
+        for tick in range(len(indexList)):
+            self.__dispatch(Px[tick], Py[tick], theta[tick], valid[tick])
+            self.__waitTick()
+
+    # 一个周期内读取所有位置，统一计算速度指令后依次下发
+    def __dispatch(self, Px, Py, theta, valid):
+        start = time.perf_counter()
+        kPosition = 1.
+        rows = np.where(valid)[0]
+
+        for row in rows:
+            self.actualPositions[row] = self.cfs[row].position()
+
+        # 期望速度和位置误差修正
+        velocity = np.stack([
+            self.actualSpeed * np.cos(theta),
+            self.actualSpeed * np.sin(theta),
+            np.zeros(self.cfNum)
+        ], axis=1)
+        desiredPos = np.stack([Px, Py, np.full(self.cfNum, self.Z)], axis=1)
+        velocity += kPosition * (desiredPos - self.actualPositions)
+
+        # 偏航角变化，单位为度
+        yawError = (theta - self.yaws) / math.pi * 180
+        yawError = np.where(yawError >= 180, 360 - yawError, np.where(yawError <= -180, -360., yawError))
+        yawRate = -yawError * self.framRate
+        self.yaws[valid] = theta[valid]
+
+        self.lastCommands[valid, 0:3] = velocity[valid]
+        self.lastCommands[valid, 3] = yawRate[valid]
+
+        for row in rows:
+            self.cfs[row].cmdVelocityWorld(velocity[row], yawRate = yawRate[row])
+
+        self.logger.log(
+            self.timeHelper.time(), self.IdArray[rows], self.actualPositions[rows],
+            desiredPos[rows], velocity[rows], theta[rows], yawRate[rows])
+
+        cost = time.perf_counter() - start
+        self.costSum += cost
+        self.costMax = max(self.costMax, cost)
+
+    # 等待到下一个周期，下发耗时超过周期时记为一次超时并重新对齐
+    def __waitTick(self):
+        now = self.timeHelper.time()
+        if self.nextTick is None:
+            self.nextTick = now
+        self.nextTick += self.period
+        self.tickNum += 1
+        if now > self.nextTick:
+            self.deadlineMisses += 1
+            self.nextTick = now
+        else:
+            self.timeHelper.sleep(self.nextTick - now)
 
     # 降落
     def goLand(self):
         print('Land!')
-        print2txt(json.dumps(self.logBuffer))
-        print('saved data')
+        print('deadline misses: {}/{}'.format(self.deadlineMisses, self.tickNum))
+        if self.tickNum > 0:
+            print('dispatch cost per tick: mean {}ms, max {}ms'.format(
+                round(self.costSum / self.tickNum * 1000, 3), round(self.costMax * 1000, 3)))
+        # 后台线程只需写入最后一块未满的记录
+        self.logger.close()
+        print('saved data, dropped telemetry chunks: {}'.format(self.logger.dropped))
         allcfsDict = self.allcfs.crazyfliesById
         cfs = allcfsDict.values()
         i = 0
@@ -3,18 +3,32 @@
 import numpy as np
 import scipy.spatial as sp
 import sys
-import matplotlib.path as mpltPath
-import math
 import copy
+import itertools
+from algorithms.fleetState import FleetState, toVirtual
 
 eps = sys.float_info.epsilon
 
 class Vor:
     # 初始化维诺Class
-    def __init__(self, box, lineSpeed, angularSpeed):
+    # method为mirror时使用镜像法，为clip时对真实点的维诺划分按边界直接裁剪
+    # boundary为凸多边形边界顶点，仅clip方法使用，默认为box对应的矩形
+    def __init__(self, box, lineSpeed, angularSpeed, method="mirror", boundary=None):
         self.box = box
         self.lineSpeed = lineSpeed
         self.angularSpeed = angularSpeed
+        self.method = method
+        if boundary is None:
+            boundary = [[box[0], box[2]], [box[1], box[2]], [box[1], box[3]], [box[0], box[3]]]
+        boundary = np.array(boundary, dtype=float)
+        # 边界统一为逆时针顺序
+        if np.sum(boundary[:, 0] * np.roll(boundary[:, 1], -1) - np.roll(boundary[:, 0], -1) * boundary[:, 1]) < 0:
+            boundary = boundary[::-1]
+        self.boundary = boundary
+        # 边界的半平面表示 normal·x <= offset
+        edges = np.roll(boundary, -1, axis=0) - boundary
+        self.boundaryNormal = np.stack([edges[:, 1], -edges[:, 0]], axis=1)
+        self.boundaryOffset = np.sum(self.boundaryNormal * boundary, axis=1)
 
     # 判断点是否在场地范围内
     def __in_box(self, towers, bounding_box):
@@ -40,81 +54,272 @@ class Vor:
             (points_down[:, 1] - bounding_box[2])
         points_up = np.copy(points_center)
         points_up[:, 1] = bounding_box[3] + (bounding_box[3] - points_up[:, 1])
-        points = np.append(points_center,
-                           np.append(np.append(points_left,
-                                               points_right,
-                                               axis=0),
-                                     np.append(points_down,
-                                               points_up,
-                                               axis=0),
-                                     axis=0),
-                           axis=0)
+        points = np.concatenate([points_center, points_left, points_right, points_down, points_up])
         # 计算维诺划分
         vor = sp.Voronoi(points)
-        # 过滤无限划分区域
-        regions = []
-        for region in vor.regions:
-            flag = True
-            for index in region:
-                if index == -1:
-                    flag = False
-                    break
-                else:
-                    x = round(vor.vertices[index, 0], 2)
-                    y = round(vor.vertices[index, 1], 2)
-                    if not(bounding_box[0] - eps <= x and x <= bounding_box[1] + eps and
-                           bounding_box[2] - eps <= y and y <= bounding_box[3] + eps):
-                        flag = False
-                        break
-            if region != [] and flag:
-                regions.append(region)
-        vor.filtered_regions = regions
+        # 所有顶点一次性判断是否在场地范围内
+        vertices = np.round(vor.vertices, 2)
+        vertexInBox = np.logical_and(
+            np.logical_and(bounding_box[0] - eps <= vertices[:, 0], vertices[:, 0] <= bounding_box[1] + eps),
+            np.logical_and(bounding_box[2] - eps <= vertices[:, 1], vertices[:, 1] <= bounding_box[3] + eps))
+        # 所有区域的顶点下标拼接为一个数组，无限远顶点-1对应末尾补上的False，一次性判断每个区域是否有限且在场地内
+        lengths = np.fromiter(map(len, vor.regions), dtype=int, count=len(vor.regions))
+        flat = np.fromiter(itertools.chain.from_iterable(vor.regions), dtype=int, count=lengths.sum())
+        outside = ~np.append(vertexInBox, False)[flat]
+        nonEmpty = lengths > 0
+        regionValid = np.zeros(len(vor.regions), dtype=bool)
+        regionValid[nonEmpty] = np.add.reduceat(outside, (np.cumsum(lengths) - lengths)[nonEmpty]) == 0
+        # 范围内的点直接通过point_region找到对应区域，过滤无限区域和超出场地的区域
+        centerRegions = vor.point_region[:len(points_center)]
+        keep = regionValid[centerRegions]
+        vor.filtered_regions = [vor.regions[region] for region in centerRegions[keep]]
+        vor.filtered_owners = np.where(i)[0][keep].tolist()
         return vor
 
-    # 维诺质心计算
-    def __centroid_region(self, vertices):
-        # Polygon's signed area
-        A = 0
-        # Centroid's x
-        C_x = 0
-        # Centroid's y
-        C_y = 0
-        for i in range(0, len(vertices) - 1):
-            s = (vertices[i, 0] * vertices[i + 1, 1] -
-                vertices[i + 1, 0] * vertices[i, 1])
-            A = A + s
-            C_x = C_x + (vertices[i, 0] + vertices[i + 1, 0]) * s
-            C_y = C_y + (vertices[i, 1] + vertices[i + 1, 1]) * s
-        A = 0.5 * A
-        C_x = round((1.0 / (6.0 * A)) * C_x, 2)
-        C_y = round((1.0 / (6.0 * A)) * C_y, 2)
-        return [C_x, C_y]
+    # 判断点是否在凸多边形边界内
+    def __in_boundary(self, towers):
+        return np.all(towers @ self.boundaryNormal.T <= self.boundaryOffset + eps, axis=1)
 
-    def updateVor(self, positionWithId):
+    # 用半平面normal·x <= offset裁剪凸多边形，所有边的交点一次性计算
+    def __clip(self, polygon, normal, offset):
+        distance = polygon @ normal - offset
+        inside = distance <= eps
+        nextPolygon = np.roll(polygon, -1, axis=0)
+        nextDistance = np.roll(distance, -1)
+        nextInside = np.roll(inside, -1)
+        # 穿过边界的边计算交点
+        cross = inside != nextInside
+        ratio = np.zeros(len(polygon))
+        ratio[cross] = distance[cross] / (distance[cross] - nextDistance[cross])
+        intersection = polygon + ratio[:, np.newaxis] * (nextPolygon - polygon)
+        # 每条边依次输出起点(若在内侧)和交点(若穿过边界)
+        candidates = np.stack([polygon, intersection], axis=1).reshape(-1, 2)
+        keep = np.stack([inside, cross], axis=1).reshape(-1)
+        return candidates[keep]
+
+    # 对真实点计算一次维诺划分，只裁剪与边界相交的区域
+    def __clipCells(self, towers):
+        owners = np.where(self.__in_boundary(towers))[0]
+        points = towers[owners]
+        n = len(points)
+        # 点数过少或共线时无法计算维诺划分，所有点两两相邻
+        try:
+            vor = sp.Voronoi(points)
+        except (RuntimeError, ValueError):
+            vor = None
+        if vor is None:
+            regions = [[-1]] * n
+            ridges = np.array([[i, j] for i in range(n) for j in range(i)], dtype=int).reshape(-1, 2)
+        else:
+            regions = [vor.regions[index] for index in vor.point_region]
+            ridges = vor.ridge_points
+            # 所有维诺顶点一次性判断是否在边界内
+            vertexInside = self.__in_boundary(vor.vertices)
+        neighbors = [[] for _ in range(n)]
+        for i, j in ridges:
+            neighbors[i].append(j)
+            neighbors[j].append(i)
+
+        cellOwners = []
+        polygons = []
+        for index in range(n):
+            region = regions[index]
+            # 完全在边界内的区域无需裁剪
+            if -1 not in region and vertexInside[region].all():
+                cellOwners.append(owners[index])
+                polygons.append(vor.vertices[region + [region[0]]])
+                continue
+            if -1 not in region:
+                # 有限区域用边界裁剪
+                polygon = vor.vertices[region]
+                for normal, offset in zip(self.boundaryNormal, self.boundaryOffset):
+                    polygon = self.__clip(polygon, normal, offset)
+                    if len(polygon) < 3:
+                        break
+            else:
+                # 无限区域用到相邻点的中垂线裁剪边界多边形，保留到自身更近的一侧
+                polygon = self.boundary
+                near = points[neighbors[index]]
+                normals = 2 * (near - points[index])
+                offsets = np.sum(near ** 2, axis=1) - np.sum(points[index] ** 2)
+                for normal, offset in zip(normals, offsets):
+                    polygon = self.__clip(polygon, normal, offset)
+                    if len(polygon) < 3:
+                        break
+            # 去掉顶点恰好落在裁剪线上时产生的重复顶点
+            polygon = polygon[np.linalg.norm(polygon - np.roll(polygon, 1, axis=0), axis=1) > 1e-9]
+            if len(polygon) >= 3:
+                cellOwners.append(owners[index])
+                polygons.append(np.append(polygon, polygon[0:1], axis=0))
+        return cellOwners, polygons
+
+    # 镜像法得到的维诺区域，首尾相接
+    def __mirrorCells(self, towers):
+        vor = self.__voronoi(towers, self.box)
+        polygons = [vor.vertices[region + [region[0]], :] for region in vor.filtered_regions]
+        return vor.filtered_owners, polygons
+
+    # 首尾相接的多边形统一为逆时针、从最左下的顶点开始，顶点保留9位小数，去掉重复的顶点和边中间共线的顶点，
+    # updateVor和localVor得到的同一单元顶点相同，落在边界上的顶点恰好在边界上；
+    # 所有多边形的顶点拼接为一个数组统一处理，group为顶点所属的多边形
+    def __canonical(self, polygons):
+        vertices = np.round(np.concatenate([polygon[:-1] for polygon in polygons]), 9)
+        group = np.repeat(np.arange(len(polygons)), [len(polygon) - 1 for polygon in polygons])
+
+        # 同一多边形内前后相邻顶点的下标，首尾循环
+        def neighbor(group, shift):
+            counts = np.bincount(group, minlength=len(polygons))
+            offsets = np.cumsum(counts) - counts
+            position = np.arange(len(group)) - offsets[group]
+            return offsets[group] + (position + shift) % counts[group], position, counts
+
+        previous, _, _ = neighbor(group, -1)
+        keep = np.linalg.norm(vertices - vertices[previous], axis=1) > 1e-9
+        vertices, group = vertices[keep], group[keep]
+        # 顶点到前后两个顶点连线的距离小于1e-7时视为共线
+        previous, _, _ = neighbor(group, -1)
+        following, _, _ = neighbor(group, 1)
+        before = vertices - vertices[previous]
+        chord = vertices[following] - vertices[previous]
+        cross = before[:, 0] * chord[:, 1] - before[:, 1] * chord[:, 0]
+        keep = np.abs(cross) > 1e-7 * np.linalg.norm(chord, axis=1)
+        vertices, group = vertices[keep], group[keep]
+
+        # 顺时针的多边形倒序
+        following, position, counts = neighbor(group, 1)
+        x, y = vertices[:, 0], vertices[:, 1]
+        area = np.bincount(group, weights=x * y[following] - x[following] * y, minlength=len(polygons))
+        position = np.where(area[group] < 0, counts[group] - 1 - position, position)
+        # 坐标取6位小数比较，两种方法之间的舍入误差不影响起点，相同时取靠前的顶点
+        order = np.lexsort((position, np.round(y, 6), np.round(x, 6), group))
+        first = position[order[np.searchsorted(group[order], np.arange(len(polygons)))]]
+        position = (position - first[group]) % counts[group]
+
+        # 按多边形和新的顶点顺序排列，每个多边形末尾补上起点
+        order = np.lexsort((position, group))
+        closed = np.concatenate([vertices[order], vertices[order][position[order] == 0]])
+        closedGroup = np.concatenate([group[order], group[order][position[order] == 0]])
+        closedPosition = np.concatenate([position[order], counts[group[order][position[order] == 0]]])
+        order = np.lexsort((closedPosition, closedGroup))
+        return np.split(closed[order], np.cumsum(counts + 1)[:-1])
+
+    # 维诺质心计算，所有多边形用最后一个顶点补齐到相同长度后统一计算
+    def __centroid_regions(self, polygons):
+        length = max([len(vertices) for vertices in polygons])
+        packed = np.array([
+            np.concatenate([vertices, np.repeat(vertices[-1:], length - len(vertices), axis=0)])
+            for vertices in polygons
+        ])
+        x, y = packed[:, :, 0], packed[:, :, 1]
+        # 补齐的重复顶点对面积和质心的贡献为0
+        s = x[:, :-1] * y[:, 1:] - x[:, 1:] * y[:, :-1]
+        A = 0.5 * s.sum(axis=1)
+        C_x = np.round(((x[:, :-1] + x[:, 1:]) * s).sum(axis=1) / (6.0 * A), 2)
+        C_y = np.round(((y[:, :-1] + y[:, 1:]) * s).sum(axis=1) / (6.0 * A), 2)
+        return np.stack([C_x, C_y], axis=1).tolist()
+
+    # 取出位置数组和Id列表，positionWithId为FleetState或包含Id和Position的列表
+    def __towers(self, positionWithId):
+        if isinstance(positionWithId, FleetState):
+            return positionWithId.positions, positionWithId.IdList
         towers = np.array(
             [cf['Position'] for cf in positionWithId]
         )
-        # 获取维诺划分
-        vor = self.__voronoi(towers, self.box)
         # 获取无人机Id
         IdList = [cf['Id'] for cf in positionWithId]
+        return towers, IdList
 
-        vorResult = []
+    # 只计算Ids对应无人机的维诺单元，单元与updateVor相同(重合的点除外)，另带相邻无人机Id集合neighbors
+    # 每个单元从场地边界开始，按距离由近到远用其他无人机的中垂线裁剪，距离超过当前单元半径两倍的无人机不可能再裁到单元，
+    # 因此只计算附近的无人机；参与划分的点与updateVor相同，范围外的无人机没有单元
+    def localVor(self, positionWithId, Ids):
+        towers, IdList = self.__towers(positionWithId)
+        if self.method == "clip":
+            region = self.boundary
+            inside = self.__in_boundary(towers)
+        else:
+            region = np.array([[self.box[0], self.box[2]], [self.box[1], self.box[2]],
+                               [self.box[1], self.box[3]], [self.box[0], self.box[3]]], dtype=float)
+            inside = self.__in_box(towers, self.box)
+        owners = np.where(inside)[0]
+        hasCell = np.copy(inside)
+        if self.method != "clip":
+            # 镜像法中在场地边界上的点与自己的镜像点重合，qhull合并后没有区域，但仍参与划分其他点的区域
+            edgeDistance = np.min(np.abs(np.stack([
+                towers[:, 0] - self.box[0], self.box[1] - towers[:, 0],
+                towers[:, 1] - self.box[2], self.box[3] - towers[:, 1]])), axis=0)
+            hasCell &= edgeDistance > 1e-13
+        rowOf = {Id: row for row, Id in enumerate(IdList)}
+
+        cellIds = []
+        polygons = []
+        neighbors = []
+        for Id in Ids:
+            row = rowOf[Id]
+            if not hasCell[row]:
+                continue
+            # 与自身重合的点不参与裁剪，与updateVor中qhull合并重合点相同
+            distance = np.linalg.norm(towers[owners] - towers[row], axis=1)
+            others = owners[distance > 0]
+            distance = distance[distance > 0]
+            order = np.argsort(distance, kind="stable")
+            polygon = region
+            normals = 2 * (towers[others] - towers[row])
+            offsets = np.sum(towers[others] ** 2, axis=1) - np.sum(towers[row] ** 2)
+            clipped = []
+            for index in order:
+                if distance[index] > 2 * np.linalg.norm(polygon - towers[row], axis=1).max():
+                    break
+                polygon = self.__clip(polygon, normals[index], offsets[index])
+                clipped.append(index)
+                if len(polygon) < 3:
+                    break
+            # 去掉顶点恰好落在裁剪线上时产生的重复顶点
+            polygon = polygon[np.linalg.norm(polygon - np.roll(polygon, 1, axis=0), axis=1) > 1e-9]
+            if len(polygon) < 3:
+                continue
+            # 单元的某条边在中垂线上的无人机为相邻无人机
+            clipped = np.array(clipped, dtype=int)
+            lineDistance = (polygon @ normals[clipped].T - offsets[clipped]) / np.linalg.norm(normals[clipped], axis=1)
+            onLine = np.abs(lineDistance) <= 1e-9
+            onEdge = np.logical_and(onLine, np.roll(onLine, -1, axis=0)).any(axis=0)
+            cellIds.append(Id)
+            polygons.append(np.append(polygon, polygon[0:1], axis=0))
+            neighbors.append(set(IdList[owner] for owner in others[clipped[onEdge]]))
 
-        for region in vor.filtered_regions:
-            # 获取顶点划分出来的范围
-            vertices = vor.vertices[region + [region[0]], :]
-            path = mpltPath.Path(vertices)
+        if len(polygons) == 0:
+            return []
 
-            # 计算质心
-            centroid = self.__centroid_region(vertices)
+        polygons = self.__canonical(polygons)
+        centroids = self.__centroid_regions(polygons)
+        return [{
+            'Id': Id,
+            'vertices': vertices,
+            'centroid': centroid,
+            'neighbors': neighborIds
+        } for Id, vertices, centroid, neighborIds in zip(cellIds, polygons, centroids, neighbors)]
 
-            # 通过维诺顶点划分出来的范围寻找标号
-            # 因为维诺划分出来的结果和输入进去的貌似顺序不同🤣
-            Id = IdList[np.where(path.contains_points(towers))[0][0]]
+    # positionWithId为FleetState或包含Id和Position的列表
+    def updateVor(self, positionWithId):
+        towers, IdList = self.__towers(positionWithId)
+
+        # 获取维诺划分
+        if self.method == "clip":
+            owners, polygons = self.__clipCells(towers)
+        else:
+            owners, polygons = self.__mirrorCells(towers)
+
+        if len(polygons) == 0:
+            return []
+        polygons = self.__canonical(polygons)
 
+        # 计算质心
+        centroids = self.__centroid_regions(polygons)
+
+        vorResult = []
+        for owner, vertices, centroid in zip(owners, polygons, centroids):
             vorResult.append({
-                'Id': Id,
+                'Id': IdList[owner],
                 'vertices': vertices,
                 'centroid': centroid
             })
@@ -125,15 +330,13 @@ class Vor:
         return self.updateVor(self.virtualPosition(positionWithId))
 
     def virtualPosition(self, positionWithId):
+        # FleetState一次性计算所有虚拟位置，返回新的FleetState
+        if isinstance(positionWithId, FleetState):
+            return positionWithId.virtual(self.lineSpeed, self.angularSpeed)
+
         # 深拷贝，避免更改到原址
         virtualList = copy.deepcopy(positionWithId)
-        # 转换为虚拟位置
+        # 转换为虚拟位置，与FleetState使用同一计算
         for cf in virtualList:
-            position = cf['Position']
-            pose = cf['Pose']
-            virtualPosition = [
-                round(position[0] - (self.lineSpeed/self.angularSpeed) * (math.sin(pose)),2),
-                round(position[1] + (self.lineSpeed/self.angularSpeed) * (math.cos(pose)),2)
-            ]
-            cf['Position'] = virtualPosition
+            cf['Position'] = toVirtual(cf['Position'][0:2], cf['Pose'], self.lineSpeed, self.angularSpeed)[0].tolist()
         return virtualList
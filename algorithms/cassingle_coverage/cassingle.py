@@ -3,11 +3,50 @@
 # 卡萨帝求解
 from casadi import *
 import numpy as np
+import time
+import os
+import shutil
+import hashlib
+import subprocess
 from scipy import interpolate
+from scipy.spatial.distance import cdist
 import matplotlib.path as mpltPath
+import warnings
+
+# 求解器每次迭代后的回调，超过截止时刻(time.time())时要求求解器停止，按求解失败处理
+# 用于在进程内停止超时的ipopt求解，casadi的fatrop接口不调用迭代回调
+class SolveDeadline(Callback):
+    def __init__(self, nx, ng, np):
+        Callback.__init__(self)
+        self.nx = nx
+        self.ng = ng
+        self.np = np
+        # 为None时不限时
+        self.deadline = None
+        self.construct('deadline', {})
+
+    def get_n_in(self): return nlpsol_n_out()
+    def get_n_out(self): return 1
+    def get_name_in(self, i): return nlpsol_out(i)
+    def get_name_out(self, i): return 'ret'
+
+    def get_sparsity_in(self, i):
+        name = nlpsol_out(i)
+        if name == 'f':
+            return Sparsity.scalar()
+        if name in ('x', 'lam_x'):
+            return Sparsity.dense(self.nx)
+        if name in ('g', 'lam_g'):
+            return Sparsity.dense(self.ng)
+        if name == 'lam_p':
+            return Sparsity.dense(self.np)
+        return Sparsity(0, 0)
+
+    def eval(self, arg):
+        return [1 if self.deadline is not None and time.time() > self.deadline else 0]
 
 class Cassingle:
-    def __init__(self, lineSpeed, angularSpeed, T, N, xRange, yRange, volume, method="Euclidean", smooth_factor = 1, xInter = 14, yInter = 9):
+    def __init__(self, lineSpeed, angularSpeed, T, N, xRange, yRange, volume, method="Euclidean", smooth_factor = 1, xInter = 14, yInter = 9, maxVertices = 10, codegen = False, codegenDir = None, parallelization = "serial", shooting = "single", solverName = "ipopt", maxWallTime = None, maxIter = None):
         self.lineSpeed = lineSpeed  # 线速度
         self.angularSpeed = angularSpeed  # 角速度
         self.T = T
@@ -24,56 +63,325 @@ class Cassingle:
         # 横纵坐标插值
         self.xInter = xInter
         self.yInter = yInter
+        # 采样点数目，欧式距离方法不需要采样点
+        self.pointNum = 0 if method == 'Euclidean' else xInter * yInter
+        # RK4每步细分次数
+        self.M = 4
+        # 求解器预留的边界数目，不足部分填充无效约束
+        self.maxVertices = maxVertices
+        # 单架无人机的参数化模型缓存，键为(N, M, 边界数目, method)
+        self.models = {}
+        # 参数化求解器缓存，联合求解器的键额外包含无人机数目和并行方式
+        self.solvers = {}
+        # 联合求解时map的并行方式，可选serial、openmp、thread
+        self.parallelization = parallelization
+        # 每架无人机最近一次求解的迭代次数和耗时
+        self.solveStats = {}
+        # 是否将求解器导出为C代码并编译，编译结果按问题结构缓存在磁盘上
+        self.codegen = codegen
+        self.codegenDir = codegenDir or os.path.join(os.path.expanduser('~'), '.cache', 'cassingle')
+        # 离散方式，single为单步打靶，只有控制量是决策变量；multiple为多步打靶，各步状态也作为决策变量，
+        # 通过连续性约束衔接，雅可比和海森矩阵按步分块稀疏，时域较长时求解更快
+        self.shooting = shooting
+        # 非线性求解器，ipopt或fatrop，fatrop利用最优控制问题的分步结构，只能用于多步打靶的逐架求解
+        self.solverName = solverName
+        # 每次求解的时间和迭代次数上限，超出或求解失败时使用后备轨迹
+        self.maxWallTime = maxWallTime
+        self.maxIter = maxIter
+        # 当前求解任务的截止时刻(time.time())，由进程池随任务设置，到时求解器停止，与maxWallTime取先到者
+        self.deadline = None
+        # fatrop没有时间上限选项，也不调用迭代回调，只能用maxIter限制求解时间
+        if solverName == 'fatrop' and maxWallTime is not None:
+            warnings.warn("fatrop has no time limit, maxWallTime and task deadlines are ignored; use maxIter instead")
+        # 各种后备轨迹的使用次数：iterate为求解器最后的可行迭代点，lloyd为朝质心的闭式控制律
+        self.fallbacks = {'iterate': 0, 'lloyd': 0}
         # 范围网格
         self.gridData = np.array([
             [round(x, 8), round(y, 8), self.intensity] for x in np.arange(-xRange, xRange, self.step) for y in np.arange(-yRange, yRange, self.step)
         ])
 
-    def update(self, vertices, centroid, virtual_vertices, Position, Pose):
-        # 声明符号变量
-        x1 = MX.sym('x1')
-        x2 = MX.sym('x2')
-        x3 = MX.sym('x3')
+    def __getstate__(self):
+        # 求解器不参与序列化，由各进程重新构建
+        state = self.__dict__.copy()
+        state['models'] = {}
+        state['solvers'] = {}
+        return state
+
+    # 构建单架无人机的参数化模型，输出目标函数和约束，相同结构只构建一次
+    def __getModel(self, edgeNum):
+        key = (self.N, self.M, edgeNum, self.method, self.shooting)
+        if key in self.models:
+            return self.models[key]
+
+        # 声明符号变量，动力学和积分器使用SX以减少运算开销
+        x1 = SX.sym('x1')
+        x2 = SX.sym('x2')
+        x3 = SX.sym('x3')
         x = vertcat(x1, x2, x3)
-        u = MX.sym('u')
+        u = SX.sym('u')
+
         # 动力学模型
         xdot = vertcat(
             (1 - u/self.angularSpeed) * self.lineSpeed * cos(x3), (1 - u/self.angularSpeed) * self.lineSpeed * sin(x3), u)
-        # 损失函数
+        f = Function('f', [x, u], [xdot])
+
+        # 时间离散化，积分器同时输出RK4各阶段的位置，损失在这些位置上统一计算
+        M = self.M
+        DT = self.T/self.N/M
+        Xs = SX.sym('Xs', 3)
+        U = SX.sym('U')
+        X = Xs
+        stages = []
+        for j in range(M):
+            k1 = f(X, U)
+            k2 = f(X + DT/2 * k1, U)
+            k3 = f(X + DT/2 * k2, U)
+            k4 = f(X + DT * k3, U)
+            stages += [X, X + DT/2 * k1, X + DT/2 * k2, X + DT * k3]
+            X = X+DT/6*(k1 + 2*k2 + 2*k3 + k4)
+        F = Function('F', [Xs, U], [X, horzcat(*stages)[0:2, :]], ['x0', 'p'], ['xf', 'xs'])
+
+        # 损失函数，采样点作为矩阵参与运算，表达式规模与采样点数无关
+        xy = MX.sym('xy', 2)
+        centroid = MX.sym('centroid', 2)
+        points = MX.sym('points', self.pointNum, 3)
         if(self.method == 'Euclidean'):
-            L = sqrt((x1 - centroid[0]) ** 2 + (x2 - centroid[1]) ** 2)
+            L = sqrt(sumsqr(xy - centroid))
         else:
+            # 维诺区域外的填充点权重为0
+            diff = points[:, 0:2] - repmat(xy.T, self.pointNum, 1)
+            L = mtimes(points[:, 2].T, sqrt(sum2(diff ** 2)))
+        l = Function('l', [xy, centroid, points], [L])
+        # 整个时域的RK4阶段共用一次调用，质心和采样点不随阶段变化
+        stageNum = 4 * M * self.N
+        lMap = l.map(stageNum, [False, True, True], [False])
+        weights = DT/6 * np.tile([1, 2, 2, 1], M * self.N)
+
+        # 求解参数：初始虚拟状态、边界线段(x0, y0, x1, y1)、质心、采样点(x, y, 权重)
+        X0 = MX.sym('X0', 3)
+        edges = MX.sym('edges', edgeNum, 4)
+
+        # 初始化非线性求解器参数，决策变量和约束同时记录标签(类别, 步, 序号)，用于热启动时整体平移已执行的步数
+        w = []
+        g = []
+        wLabels = []
+        gLabels = []
+        stagePositions = []
+        Xk = X0
+        track = [X0]
+        radius = self.lineSpeed/self.angularSpeed
+
+        if self.shooting == 'multiple':
+            # 边界线段写成半平面，真实位置point满足normals * point - offsets在规定的一侧
+            normals = horzcat(edges[:, 3] - edges[:, 1], edges[:, 0] - edges[:, 2])
+            offsets = edges[:, 0] * (edges[:, 3] - edges[:, 1]) - edges[:, 1] * (edges[:, 2] - edges[:, 0])
+            # 决策变量按X0, U0, X1, U1, ..., XN排列，约束按步排列，每一步先是连续性约束，
+            # 再是该步状态的约束，第0步的约束为初始状态，这样的结构可以直接交给fatrop
+            Xk = MX.sym('X_0', 3)
+            w += [Xk]
+            wLabels += [('X', 0, j) for j in range(3)]
+            track = [Xk]
+            for k in range(self.N):
+                Uk = MX.sym('U_' + str(k))
+                Fk = F(x0=Xk, p=Uk)
+                stagePositions += [Fk['xs']]
+
+                # 下一步状态作为决策变量，与积分结果之间加连续性约束
+                Xnext = MX.sym('X_' + str(k + 1), 3)
+                w += [Uk, Xnext]
+                wLabels += [('U', k, 0)] + [('X', k + 1, j) for j in range(3)]
+                track += [Xnext]
+                g += [Xnext - Fk['xf']]
+                gLabels += [('gap', k, j) for j in range(3)]
+
+                if k == 0:
+                    g += [Xk - X0]
+                    gLabels += [('init', 0, j) for j in range(3)]
+                else:
+                    # 每一步的边界约束只与当步状态有关
+                    point = vertcat(Xk[0] + radius*sin(Xk[2]), Xk[1] - radius*cos(Xk[2]))
+                    g += [mtimes(normals, point) - offsets]
+                    gLabels += [('edge', k, i) for i in range(edgeNum)]
+
+                Xk = Xnext
+
+            point = vertcat(Xk[0] + radius*sin(Xk[2]), Xk[1] - radius*cos(Xk[2]))
+            g += [mtimes(normals, point) - offsets]
+            gLabels += [('edge', self.N, i) for i in range(edgeNum)]
+        else:
+            for k in range(self.N):
+                Uk = MX.sym('U_' + str(k))
+                w += [Uk]
+                wLabels += [('U', k, 0)]
+
+                Fk = F(x0=Xk, p=Uk)
+                Xk = Fk['xf']
+                stagePositions += [Fk['xs']]
+                track += [Xk]
+
+                # 添加约束，填充的边界线段全为0，约束恒为0
+                for i in range(edgeNum):
+                    g += [(Xk[0] + radius*sin(Xk[2]) - edges[i, 0]) * (edges[i, 3] - edges[i, 1]) -
+                        (Xk[1] - radius*cos(Xk[2]) - edges[i, 1]) * (edges[i, 2] - edges[i, 0])]
+                gLabels += [('edge', k + 1, i) for i in range(edgeNum)]
+
+        # 目标函数为各阶段损失的RK4加权和
+        J = mtimes(lMap(horzcat(*stagePositions), centroid, points), weights)
+
+        # 模型以决策变量和求解参数为输入
+        w = vertcat(*w)
+        p = vertcat(X0, vec(edges), centroid, vec(points))
+        nlp = Function('nlp', [w, p], [J, vertcat(*g)], ['w', 'p'], ['f', 'g'])
+
+        # 由决策变量还原虚拟轨迹
+        trajectory = Function('trajectory', [w, p], [horzcat(*track)])
+
+        # 由控制量正向积分得到完整的决策变量，单步打靶即为控制量本身
+        controls = MX.sym('controls', self.N)
+        expanded = [controls]
+        if self.shooting == 'multiple':
+            expanded = [X0]
+            Xk = X0
+            for k in range(self.N):
+                Xk = F(x0=Xk, p=controls[k])['xf']
+                expanded += [controls[k], Xk]
+
+        # 问题结构：模型和积分器，由控制量得到决策变量，哪些决策变量是控制量，
+        # 控制u限制在[-0.5, 0.5]，状态不限制，各约束对应的边界线段序号，连续性约束和初始状态约束为-1，是等式约束
+        layout = {
+            'nlp': nlp,
+            'F': F,
+            'expand': Function('expand', [controls, p], [vertcat(*expanded)]),
+            'control': np.array([label[0] == 'U' for label in wLabels]),
+            'lbw': [-0.5 if label[0] == 'U' else -inf for label in wLabels],
+            'ubw': [0.5 if label[0] == 'U' else inf for label in wLabels],
+            'edgeIndex': np.array([label[2] if label[0] == 'edge' else -1 for label in gLabels], dtype=int),
+            'equality': [label[0] != 'edge' for label in gLabels]
+        }
+
+        self.models[key] = (nlp, trajectory, layout)
+        return self.models[key]
+
+    # 求解器选项
+    def __options(self, solverName, layout):
+        if solverName == 'fatrop':
+            # fatrop根据等式约束自动识别各步的状态、控制量和约束
+            opts = {"fatrop.print_level": 0, "print_time": False,
+                "structure_detection": "auto", "equality": layout['equality']}
+            if self.maxIter is not None:
+                opts["fatrop.max_iter"] = self.maxIter
+            return opts
+        # 屏蔽输出，太多啦
+        opts = {"ipopt.print_level":0, "print_time": False}
+        if self.maxWallTime is not None:
+            opts["ipopt.max_wall_time"] = self.maxWallTime
+        if self.maxIter is not None:
+            opts["ipopt.max_iter"] = self.maxIter
+        return opts
+
+    # 预先构建逐架求解用到的求解器，边界数目不超过maxVertices时都使用这一结构，避免首次求解时构建
+    def prepare(self):
+        self.__getSolver(self.maxVertices)
+
+    # 构建参数化求解器，相同结构只构建一次，返回值额外包含求解器的截止时刻回调
+    def __getSolver(self, edgeNum):
+        key = (self.N, self.M, edgeNum, self.method, self.shooting, self.solverName)
+        if key in self.solvers:
+            return self.solvers[key]
+
+        nlp, trajectory, layout = self.__getModel(edgeNum)
+        w = MX.sym('w', nlp.size1_in(0))
+        p = MX.sym('p', nlp.size1_in(1))
+        J, g = nlp(w, p)
+
+        # 创建求解器，ipopt附加截止时刻回调，回调不影响问题结构，编译时不计入
+        prob = {'f': J, 'x': w, 'g': g, 'p': p}
+        opts = self.__options(self.solverName, layout)
+        stopper = None
+        solverOpts = opts
+        if self.solverName == 'ipopt':
+            stopper = SolveDeadline(w.numel(), g.numel(), p.numel())
+            solverOpts = dict(opts, iteration_callback=stopper)
+        solver = nlpsol('solver', self.solverName, prob, solverOpts)
+        # solver = nlpsol('solver', 'ipopt', prob)  # 完全输出
+        if self.codegen:
+            solver = nlpsol('solver', self.solverName, self.__compileSolver(solver, key, opts), solverOpts)
+
+        self.solvers[key] = (solver, trajectory, layout, stopper)
+        return self.solvers[key]
+
+    # 构建多架无人机的联合求解器，各无人机的模型通过map批量计算，问题按无人机分块
+    def __getBatchSolver(self, edgeNum, num):
+        key = (self.N, self.M, edgeNum, self.method, self.shooting, num, self.parallelization)
+        if key in self.solvers:
+            return self.solvers[key]
+
+        nlp, trajectory, layout = self.__getModel(edgeNum)
+        # 每一列对应一架无人机的决策变量和求解参数
+        W = MX.sym('W', nlp.size1_in(0), num)
+        P = MX.sym('P', nlp.size1_in(1), num)
+        J, G = nlp.map(num, self.parallelization)(W, P)
+
+        # 创建求解器，按列展开后各无人机的变量和约束连续存放，不再是分步结构，只能使用ipopt
+        prob = {'f': sum2(J), 'x': vec(W), 'g': vec(G), 'p': vec(P)}
+        opts = self.__options('ipopt', layout)
+        solver = nlpsol('solver', 'ipopt', prob, opts)
+        if self.codegen:
+            solver = nlpsol('solver', 'ipopt', self.__compileSolver(solver, key, opts), opts)
+
+        self.solvers[key] = (solver, trajectory, layout)
+        return self.solvers[key]
+
+    # 导出求解器所需的函数(目标、梯度、雅可比、海森)并编译为动态库，已编译过则直接复用
+    def __compileSolver(self, solver, key, opts):
+        # 问题结构由求解器键、模型常数和求解器选项共同决定
+        structure = repr((key, self.lineSpeed, self.angularSpeed, self.T, self.pointNum,
+            sorted(opts.items()), CasadiMeta.version()))
+        name = 'cassingle_' + hashlib.sha1(structure.encode('utf-8')).hexdigest()[:16]
+        library = os.path.join(self.codegenDir, name + '.so')
+        if os.path.exists(library):
+            return library
+
+        if not os.path.isdir(self.codegenDir):
+            os.makedirs(self.codegenDir, exist_ok=True)
+        # 代码只能生成在当前目录，加上进程号避免多进程同时生成时冲突
+        tempName = '{}_{}'.format(name, os.getpid())
+        source = os.path.join(self.codegenDir, tempName + '.c')
+        shutil.move(solver.generate_dependencies(tempName + '.c'), source)
+        tempLibrary = os.path.join(self.codegenDir, tempName + '.so')
+        # openmp并行的map需要编译器支持
+        flags = ['-fopenmp'] if self.parallelization == 'openmp' else []
+        subprocess.check_call(['gcc', '-fPIC', '-shared', '-O3'] + flags + [source, '-o', tempLibrary])
+        # 原子替换，其它进程不会读到不完整的动态库
+        os.replace(tempLibrary, library)
+        os.remove(source)
+        return library
+
+    # 边界数目不足时填充无效约束
+    def __edgeNum(self, vertices):
+        return max(vertices.shape[0] - 1, self.maxVertices)
+
+    # 整理单架无人机的求解参数和约束上下界
+    def __parameters(self, vertices, centroid, virtual_vertices, Position, Pose, edgeNum, layout):
+        # 采样点，格式为(x, y, 权重)
+        points = np.zeros((self.pointNum, 3))
+        if(self.method != 'Euclidean'):
             # 使用path判断生成的点是否在维诺区域内，并进行误差计算
             temp = np.array(virtual_vertices)
             xRange = [min(temp[:, 0]), max(temp[:, 0])]
             yRange = [min(temp[:, 1]), max(temp[:, 1])]
-            points = [
+            samples = [
                 (xPos, yPos)
                 for xPos in np.linspace(xRange[0], xRange[1], self.xInter)
                 for yPos in np.linspace(yRange[0], yRange[1], self.yInter)
             ]
             path = mpltPath.Path(virtual_vertices)
-            pointsInPolygon = np.array(points)[path.contains_points(points)]
-            L = 0
-            for point in pointsInPolygon:
-                L += sqrt((x1 - point[0]) ** 2 + (x2 - point[1]) ** 2)
-
-        # 时间离散化
-        M = 4
-        DT = self.T/self.N/M
-        f = Function('f', [x, u], [xdot, L])
-        X0 = MX.sym('X0', 3)
-        U = MX.sym('U')
-        X = X0
-        Q = 0
-        for j in range(M):
-            k1, k1_q = f(X, U)
-            k2, k2_q = f(X + DT/2 * k1, U)
-            k3, k3_q = f(X + DT/2 * k2, U)
-            k4, k4_q = f(X + DT * k3, U)
-            X = X+DT/6*(k1 + 2*k2 + 2*k3 + k4)
-            Q = Q + DT/6*(k1_q + 2*k2_q + 2*k3_q + k4_q)
-        F = Function('F', [X0, U], [X, Q], ['x0', 'p'], ['xf', 'qf'])
+            pointsInPolygon = np.array(samples)[path.contains_points(samples)]
+            # 填充点放在场地外，避免距离为0时梯度无定义
+            points[:, 0] = 2 * self.xRange
+            points[:, 1] = 2 * self.yRange
+            points[:len(pointsInPolygon), 0:2] = pointsInPolygon
+            points[:len(pointsInPolygon), 2] = 1
 
         # 为了计算点和线的位置情况，在顶点数组末尾拼接上第二个值
         verticesX = np.append(vertices[:, 0], vertices[1, 0])
@@ -81,82 +389,45 @@ class Cassingle:
 
         # 边界判断
         verticesNum = vertices.shape[0] - 1
-        # 高低边界
-        lowBound = [0] * verticesNum
-        upBound = [0] * verticesNum
+
+        # 边界线段，未使用部分为0
+        edges = np.zeros((edgeNum, 4))
+        edges[:verticesNum, 0] = verticesX[:verticesNum]
+        edges[:verticesNum, 1] = verticesY[:verticesNum]
+        edges[:verticesNum, 2] = verticesX[1:verticesNum + 1]
+        edges[:verticesNum, 3] = verticesY[1:verticesNum + 1]
+
+        # 高低边界，无效约束上下界均为无穷
+        lowBound = [-inf] * edgeNum
+        upBound = [inf] * edgeNum
 
         # 判断点与边界线的关系
         for index in range(verticesNum):
             if(((verticesX[index + 2] - verticesX[index]) * (verticesY[index + 1] - verticesY[index]) -
                 (verticesY[index + 2] - verticesY[index]) * (verticesX[index + 1] - verticesX[index])) > 0):
-                upBound[index] = inf
+                lowBound[index] = 0
             else:
-                lowBound[index] = -inf
-
-        # 初始化非线性求解器参数
-        w = []
-        w0 = []
-        lbw = []
-        ubw = []
-        J = 0
-        g = []
-        lbg = []
-        ubg = []
+                upBound[index] = 0
 
         # 转换为虚拟姿态
         VirtualX = round(Position[0] - (self.lineSpeed/self.angularSpeed) * (sin(Pose)), 8)
         VirtualY = round(Position[1] + (self.lineSpeed/self.angularSpeed) * (cos(Pose)), 8)
         VirtualZ = Pose
-        Xk = [VirtualX, VirtualY, VirtualZ]
 
         # 非线性求解器参数
-        for k in range(self.N):
-            Uk = MX.sym('U_' + str(k))
-            w += [Uk]
-            lbw += [-0.5]  # 控制u上界
-            ubw += [0.5]  # 控制u下界
-            w0 += [0]
-
-            Fk = F(x0=Xk, p=Uk)
-            Xk = Fk['xf']
-            J += Fk['qf']
-
-            # 添加约束
-            for i in range(verticesNum):
-                g += [(Xk[0] + (self.lineSpeed/self.angularSpeed)*sin(Xk[2]) - verticesX[i]) * (verticesY[i+1] - verticesY[i]) -
-                    (Xk[1] - (self.lineSpeed/self.angularSpeed)*cos(Xk[2]) - verticesY[i]) * (verticesX[i+1] - verticesX[i])]
-
-            # 无人机自身体积约束避撞
-            # for i in range(verticesNum):
-            #     g += [fabs(Xk[0] + (self.lineSpeed/self.angularSpeed)*sin(Xk[2]) - verticesX[i]) * (verticesY[i+1] - verticesY[i]) -
-            #         (Xk[1] - (self.lineSpeed/self.angularSpeed)*cos(Xk[2]) - verticesY[i]) * (verticesX[i+1] - verticesX[i]) \
-            #         / sqrt((verticesY[i+1] - verticesY[i])**2 + (verticesX[i+1] - verticesX[i]))]
-
-            lbg += lowBound
-            ubg += upBound
-
-            # for i in range(verticesNum):
-            #     lbg += [self.volume]
-            #     ubg += [inf]
-
-        # 创建求解器
-        prob = {'f': J, 'x': vertcat(*w), 'g': vertcat(*g)}
-        # 屏蔽输出，太多啦
-        opts = {"ipopt.print_level":0, "print_time": False}
-        solver = nlpsol('solver', 'ipopt', prob, opts)
-        # solver = nlpsol('solver', 'ipopt', prob)  # 完全输出
-
-        # 求解
-        sol = solver(x0=w0, lbx=lbw, ubx=ubw, lbg=lbg, ubg=ubg)
-        u_opt = sol['x']
-
-        # 解析求解结果，求解器输出是numpy数组，艹
-        x_opt = [[VirtualX, VirtualY, VirtualZ]]
-        for k in range(self.N):
-            Fk = F(x0=x_opt[-1], p=u_opt[k])
-            res = Fk['xf'].full().reshape([3]).tolist()
-            x_opt += [res]
+        edgeIndex = layout['edgeIndex']
+        lbg = np.where(edgeIndex >= 0, np.array(lowBound)[edgeIndex], 0).tolist()
+        ubg = np.where(edgeIndex >= 0, np.array(upBound)[edgeIndex], 0).tolist()
+        p = np.concatenate([
+            [VirtualX, VirtualY, VirtualZ],
+            edges.flatten('F'),
+            np.array(centroid, dtype=float),
+            points.flatten('F')
+        ])
+        return p, lbg, ubg
 
+    # 将虚拟轨迹还原为真实位置
+    def __restore(self, x_opt):
         # 把第一个初始位置给移掉
         # x_opt.pop(0)
 
@@ -185,14 +456,214 @@ class Cassingle:
         else:
             return self.opt_smooth(x_opt)
 
-    # 计算loss
+    def update(self, vertices, centroid, virtual_vertices, Position, Pose, Id=None):
+        edgeNum = self.__edgeNum(vertices)
+        nlp, trajectory, layout = self.__getModel(edgeNum)
+        p, lbg, ubg = self.__parameters(vertices, centroid, virtual_vertices, Position, Pose, edgeNum, layout)
+        lbw, ubw = layout['lbw'], layout['ubw']
+
+        # 初值为控制量全0时积分得到的决策变量
+        x0 = layout['expand'](0, p).full().flatten()
+        solver, trajectory, layout, stopper = self.__getSolver(edgeNum)
+
+        # 求解，截止时刻取任务截止时刻和单次求解时间上限中较早的
+        solveStart = time.time()
+        if stopper is not None:
+            limits = [limit for limit in [self.deadline, None if self.maxWallTime is None else solveStart + self.maxWallTime]
+                if limit is not None]
+            stopper.deadline = min(limits) if len(limits) > 0 else None
+        sol = solver(x0=x0, lbx=lbw, ubx=ubw, lbg=lbg, ubg=ubg, p=p)
+        w_opt = sol['x'].full().flatten()
+
+        # 超时或求解失败时改用后备轨迹
+        stats = solver.stats()
+        fallback = None
+        if not stats['success']:
+            w_opt, fallback = self.__fallback(w_opt, layout, p, lbg, ubg, centroid)
+
+        # 记录求解的迭代次数和耗时
+        self.solveStats[Id] = {
+            'iter': stats['iter_count'],
+            'time': time.time() - solveStart,
+            'fallback': fallback
+        }
+
+        # 解析求解结果，求解器输出是numpy数组，艹
+        x_opt = trajectory(w_opt, p).full().T.tolist()
+
+        return self.__restore(x_opt)
+
+    # 所有无人机在一个联合问题中同时求解，参数为各无人机的列表，返回值与update相同的轨迹列表
+    def update_all(self, allVertices, allCentroids, allVirtualVertices, positions, poses, Ids=None):
+        num = len(allVertices)
+        if Ids is None:
+            Ids = [None] * num
+
+        # 所有无人机共用相同的边界数目
+        edgeNum = max([self.__edgeNum(vertices) for vertices in allVertices])
+        nlp, trajectory, layout = self.__getModel(edgeNum)
+        params = [
+            self.__parameters(allVertices[index], allCentroids[index], allVirtualVertices[index],
+                positions[index], poses[index], edgeNum, layout)
+            for index in range(num)
+        ]
+        p = np.concatenate([param[0] for param in params])
+        # casadi的sum会覆盖内置sum，这里直接展开
+        lbg = [bound for param in params for bound in param[1]]
+        ubg = [bound for param in params for bound in param[2]]
+
+        # 每架无人机的决策变量数目
+        wNum = len(layout['lbw'])
+        lbw = layout['lbw'] * num
+        ubw = layout['ubw'] * num
+
+        # 初值按无人机顺序拼接，每架为控制量全0时积分得到的决策变量
+        x0 = np.concatenate([layout['expand'](0, param[0]).full().flatten() for param in params])
+        solver, trajectory, layout = self.__getBatchSolver(edgeNum, num)
+
+        # 求解
+        solveStart = time.time()
+        sol = solver(x0=x0, lbx=lbw, ubx=ubw, lbg=lbg, ubg=ubg, p=p)
+        solveTime = time.time() - solveStart
+        stats = solver.stats()
+
+        x = sol['x'].full().flatten()
+
+        outPut = []
+        for index, Id in enumerate(Ids):
+            w_opt = x[index * wNum:(index + 1) * wNum]
+
+            # 联合求解超时或失败时逐架检查，不满足约束的无人机改用后备轨迹
+            fallback = None
+            if not stats['success']:
+                w_opt, fallback = self.__fallback(w_opt, layout, params[index][0],
+                    params[index][1], params[index][2], allCentroids[index])
+
+            # 联合求解只有一组统计，记录到每架无人机
+            self.solveStats[Id] = {
+                'iter': stats['iter_count'],
+                'time': solveTime,
+                'batch': num,
+                'fallback': fallback
+            }
+            outPut.append(self.__restore(trajectory(w_opt, params[index][0]).full().T.tolist()))
+
+        return outPut
+
+    # 不求解，直接使用后备轨迹，用于求解任务没有按时返回的情况，返回值与update相同
+    def fallback(self, vertices, centroid, virtual_vertices, Position, Pose, Id=None):
+        edgeNum = self.__edgeNum(vertices)
+        nlp, trajectory, layout = self.__getModel(edgeNum)
+        p, lbg, ubg = self.__parameters(vertices, centroid, virtual_vertices, Position, Pose, edgeNum, layout)
+
+        w_opt, fallback = self.__fallback(None, layout, p, lbg, ubg, centroid)
+
+        self.solveStats[Id] = {
+            'iter': 0,
+            'time': 0.,
+            'fallback': fallback
+        }
+
+        return self.__restore(trajectory(w_opt, p).full().T.tolist())
+
+    # 后备轨迹，依次尝试求解器最后的迭代点、朝质心的闭式控制律，迭代点需要满足约束，
+    # 闭式控制律逐步限制在维诺区域内，返回决策变量和使用的后备类别
+    def __fallback(self, w, layout, p, lbg, ubg, centroid):
+        if w is not None and self.__feasible(w, layout, p, lbg, ubg):
+            kind = 'iterate'
+        else:
+            kind = 'lloyd'
+            w = layout['expand'](self.__lloyd(layout, p, lbg, ubg, centroid), p).full().flatten()
+        self.fallbacks[kind] += 1
+        return w, kind
+
+    # 决策变量是否满足约束
+    def __feasible(self, w, layout, p, lbg, ubg):
+        g = layout['nlp'](w, p)[1].full().flatten()
+        return bool(np.all(g >= np.array(lbg) - 1e-6) and np.all(g <= np.array(ubg) + 1e-6))
+
+    # 朝质心的闭式控制律，虚拟位置的速度为(1 - u/angularSpeed) * lineSpeed，u取角速度时原地转圈，虚拟位置不动；
+    # 朝向偏差较大或已接近质心时原地转圈，否则按偏差小幅转向并前进，u限制在[-angularSpeed, angularSpeed]，速度不超过2倍线速度
+    # 真实位置以线速度lineSpeed沿朝向前进，u只改变转弯半径lineSpeed/|u|，无法停下，控制量保持不变时真实位置沿圆周运动；
+    # 每一步选取最接近控制律的控制量，要求下一步的真实位置在维诺区域内，且此后以最大转速转圈的圆在区域内，
+    # 这样之后总能转圈停留在区域内；没有这样的控制量时取不越界且转圈的圆最接近放得下的，仍没有时取越界最少的，
+    # 区域窄于转圈的圆或起点朝外贴近边界时无法完全避免越界
+    def __lloyd(self, layout, p, lbg, ubg, centroid):
+        F = layout['F']
+        stepTime = self.T / self.N
+        limit = min(0.5, self.angularSpeed)
+        radius = self.lineSpeed / self.angularSpeed
+
+        # 从求解参数和约束上下界中取出边界线段(x0, y0, x1, y1)和每条边界的上下界
+        edgeIndex = layout['edgeIndex']
+        edgeNum = edgeIndex.max() + 1
+        first = [np.where(edgeIndex == i)[0][0] for i in range(edgeNum)]
+        lowEdge = np.array(lbg, dtype=float)[first]
+        upEdge = np.array(ubg, dtype=float)[first]
+        edges = np.array(p[3:3 + 4 * edgeNum], dtype=float).reshape(4, edgeNum).T
+
+        # 有效边界的长度和区域内侧的方向，填充的边界长度为0
+        length = np.hypot(edges[:, 2] - edges[:, 0], edges[:, 3] - edges[:, 1])
+        valid = length > 0
+        side = np.where(lowEdge == 0, 1., -1.)
+        uMax = max(abs(bound) for bound in layout['ubw'] if bound != inf)
+
+        # 点在各边界上的约束值
+        def edgeValue(px, py):
+            return (px - edges[:, 0]) * (edges[:, 3] - edges[:, 1]) - (py - edges[:, 1]) * (edges[:, 2] - edges[:, 0])
+
+        # 状态对应的真实位置超出边界的最大量
+        def violation(X):
+            value = edgeValue(X[0] + radius * np.sin(X[2]), X[1] - radius * np.cos(X[2]))
+            return max(0., np.max(lowEdge - value), np.max(value - upEdge))
+
+        # 以最大转速向左或向右转圈的圆超出区域的量，即半径减去圆心到各边界内侧的最小距离，取两个方向中较小的，为0时圆在区域内
+        def circleDeficit(X):
+            px, py = X[0] + radius * np.sin(X[2]), X[1] - radius * np.cos(X[2])
+            turn = self.lineSpeed / uMax
+            deficit = inf
+            for sign in [1., -1.]:
+                cx, cy = px - sign * turn * np.sin(X[2]), py + sign * turn * np.cos(X[2])
+                margin = side[valid] * edgeValue(cx, cy)[valid] / length[valid]
+                deficit = min(deficit, max(0., turn - margin.min()))
+            return deficit
+
+        X = np.array(p[0:3], dtype=float)
+        controls = []
+        for k in range(self.N):
+            dx, dy = centroid[0] - X[0], centroid[1] - X[1]
+            error = np.arctan2(dy, dx) - X[2]
+            error = np.arctan2(np.sin(error), np.cos(error))
+            if np.hypot(dx, dy) < self.lineSpeed * stepTime or abs(error) > np.pi / 4:
+                u = limit
+            else:
+                u = float(np.clip(error / stepTime, -limit, limit))
+
+            # 按(是否越界, 转圈超出量, 越界量)选取，找到可以转圈且不越界的控制量即停止
+            best = None
+            for candidate in [u] + sorted(np.linspace(-uMax, uMax, 21).tolist(), key=lambda c: abs(c - u)):
+                nextX = F(x0=X, p=candidate)['xf'].full().flatten()
+                amount = violation(nextX)
+                rank = (amount > 1e-6, circleDeficit(nextX), amount)
+                if best is None or rank < best[0]:
+                    best = (rank, candidate, nextX)
+                if not rank[0] and rank[1] == 0:
+                    break
+            controls.append(best[1])
+            X = best[2]
+        return controls
+
+    # 计算loss，position为单个时刻的位置(n, 2)，或整条轨迹各时刻的位置(N, n, 2)
     def loss(self, position):
-        loss = 0.
-        for point in self.gridData:
-            posList = position - point[0:2]
-            lossList = (posList[:, 0] ** 2 + posList[: ,1] ** 2) * point[2]
-            loss += round(sqrt(lossList.min()), 8)
-        return loss
+        position = np.asarray(position, dtype=float)
+        if position.ndim == 2:
+            return float(self.loss(position[np.newaxis])[0])
+
+        # 所有时刻的无人机位置堆叠后一次性计算到网格点的距离平方，取每个时刻最近的无人机，网格点权重作用在距离平方上
+        timeNum, flieNum = position.shape[0], position.shape[1]
+        dist = cdist(position.reshape(-1, 2), self.gridData[:, 0:2])
+        dist = dist.reshape(timeNum, flieNum, -1).min(axis=1)
+        return np.round(np.sqrt(dist ** 2 * self.gridData[:, 2]), 8).sum(axis=1)
 
     def opt_smooth(self, opt):
         originNum = len(opt)
@@ -1,24 +1,22 @@
 # -*- coding: UTF-8 -*-
 #!/usr/bin/env python
 import matplotlib.pyplot as plt
+import numpy as np
 
 class Graph:
     def __init__(self, IdList, xRange, yRange):
-        # 获取命名空间
-        names = self.__dict__
+        # 无人机Id到句柄下标的映射，Id统一转换为字符串
+        self.rows = {str(Id): row for row, Id in enumerate(IdList)}
 
         # 创建绘图句柄
         fig, ax = plt.subplots()
 
-        # 根据无人机ID动态申请变量
-        for Id in IdList:
-            # 加逗号，不然取不出来
-            names['line' + Id], = plt.plot([], [], '.-', label='flight'+Id)
-            names['track_his' + Id] = [[], []]
+        # 每架无人机的轨迹句柄和历史轨迹
+        self.lines = [plt.plot([], [], '.-', label='flight'+str(Id))[0] for Id in IdList]
+        self.tracks = [[] for Id in IdList]
         # 仅显示✈的label
         plt.legend()
-        for Id in IdList:
-            names['ridges_handle' + Id], = plt.plot([], [], 'k-', label='ridges')
+        self.ridgesHandles = [plt.plot([], [], 'k-', label='ridges')[0] for Id in IdList]
 
         self.centroids_handle, = plt.plot([], [], 'go', label='centriods')
 
@@ -28,19 +26,17 @@ class Graph:
 
     # 更新轨迹信息
     def updateTrack(self, waypoints, Id):
-        # 根据ID动态执行
-        exec("self.track_his{}[0].append(waypoints[:, 0].tolist())".format(Id))
-        exec("self.track_his{}[1].append(waypoints[:, 1].tolist())".format(Id))
-        exec("self.line{}.set_data(self.track_his{}[0], self.track_his{}[1])".format(
-            Id, Id, Id))
+        row = self.rows[str(Id)]
+        self.tracks[row].append(waypoints[:, 0:2])
+        track = np.concatenate(self.tracks[row])
+        self.lines[row].set_data(track[:, 0], track[:, 1])
         plt.pause(0.0001)
 
     # 更新维诺划分区域
     def updateRidges(self, positionWithId):
         for cf in positionWithId:
             ridges = cf['vertices']
-            Id = str(cf['Id'])
-            exec("self.ridges_handle{}.set_data(ridges[:, 0], ridges[:, 1])".format(Id))
+            self.ridgesHandles[self.rows[str(cf['Id'])]].set_data(ridges[:, 0], ridges[:, 1])
 
     # 更新维诺质心
     def updateCentroid(self, centroid):
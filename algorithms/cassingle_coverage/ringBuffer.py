@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 单生产者单消费者的有界环形缓冲区，规划线程写入，飞控线程读取
+import threading
+
+class RingBuffer:
+    def __init__(self, capacity):
+        # 多留一个空位区分满和空
+        self.size = capacity + 1
+        self.slots = [None] * self.size
+        # head只由消费者修改，tail只由生产者修改，读写数据不需要加锁
+        self.head = 0
+        self.tail = 0
+        self.closed = False
+        # 只在缓冲区空或满需要等待时使用
+        self.notEmpty = threading.Event()
+        self.notFull = threading.Event()
+
+    def __len__(self):
+        return (self.tail - self.head) % self.size
+
+    def empty(self):
+        return self.head == self.tail
+
+    def full(self):
+        return (self.tail + 1) % self.size == self.head
+
+    # 写入一项，缓冲区满时阻塞，超时返回False
+    def put(self, item, timeout=None):
+        while self.full():
+            self.notFull.clear()
+            # 清除后再次确认，避免错过消费者的通知
+            if self.full() and not self.notFull.wait(timeout):
+                return False
+        self.slots[self.tail] = item
+        self.tail = (self.tail + 1) % self.size
+        self.notEmpty.set()
+        return True
+
+    # 取出一项，缓冲区空时阻塞；已关闭且取完时返回None，超时同样返回None
+    def get(self, timeout=None):
+        while self.empty():
+            if self.closed:
+                return None
+            self.notEmpty.clear()
+            if self.empty() and not self.closed and not self.notEmpty.wait(timeout):
+                return None
+        item = self.slots[self.head]
+        self.slots[self.head] = None
+        self.head = (self.head + 1) % self.size
+        self.notFull.set()
+        return item
+
+    # 生产者结束，消费者取完剩余数据后get返回None
+    def close(self):
+        self.closed = True
+        self.notEmpty.set()
@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 常驻求解进程池
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, wait
+import multiprocessing
+import os
+import time
+import numpy as np
+
+# 每个进程常驻的求解实例，由进程池初始化时创建
+residentCassingle = None
+
+# 进程启动时预先构建求解器，完成后把进程号发回主进程，第一个任务不再包含构建时间
+def initWorker(instance, ready):
+    global residentCassingle
+    residentCassingle = instance
+    if instance is not None:
+        instance.prepare()
+    ready.put(os.getpid())
+
+# deadline为本任务的截止时刻，正在进行的求解到时停止，使用后备轨迹，不占用后面的任务时间；
+# 开始时已经过了截止时刻的任务结果不会再被使用，直接跳过
+def runTask(func, args, deadline=None):
+    if deadline is not None and time.time() > deadline:
+        return None
+    if residentCassingle is not None:
+        residentCassingle.deadline = deadline
+    return func(residentCassingle, *args)
+
+# 空任务，用于启动所有进程
+def idleTask(instance):
+    return None
+
+# 打包求解任务，顶点、质心和起始状态拼接为一段float64数据，只附带两个顶点数目
+def packTask(Id, vertices, virtualVertices, centroid, position, pose):
+    buffer = np.concatenate([
+        np.ravel(vertices),
+        np.ravel(virtualVertices),
+        np.ravel(centroid),
+        [position[0], position[1], pose]
+    ]).astype(np.float64).tobytes()
+    return (Id, len(vertices), len(virtualVertices), buffer)
+
+# 解包求解任务，返回Id、真实顶点、虚拟顶点、质心、位置和朝向
+def unpackTask(message):
+    Id, verticesNum, virtualNum, buffer = message
+    data = np.frombuffer(buffer, dtype=np.float64)
+    vertices = data[:2 * verticesNum].reshape(verticesNum, 2)
+    virtualVertices = data[2 * verticesNum:2 * (verticesNum + virtualNum)].reshape(virtualNum, 2)
+    centroid, state = data[-5:-3], data[-3:]
+    return Id, vertices, virtualVertices, centroid.tolist(), state[0:2].tolist(), float(state[2])
+
+class SolverPool:
+    def __init__(self, instance, processNum=None):
+        # 进程数默认和CPU核数相同
+        self.processNum = processNum or multiprocessing.cpu_count()
+        # 求解实例只在进程启动时传递一次，之后的任务只携带求解参数
+        ready = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processNum,
+            initializer=initWorker,
+            initargs=(instance, ready)
+        )
+        # 同时提交和进程数相同的空任务，所有进程启动，等待各进程构建完求解器，记下子进程号
+        futures = [self.submit(idleTask) for _ in range(self.processNum)]
+        self.pids = set(ready.get() for _ in range(self.processNum))
+        wait(futures)
+
+    # 提交单个任务，func的第一个参数为进程内常驻的求解实例，deadline为任务的截止时刻，含义与runTask相同
+    def submit(self, func, *args, deadline=None):
+        return self.executor.submit(runTask, func, args, deadline)
+
+    # 提交一批任务并阻塞等待结果，timeout为整批任务的时限，超时抛出concurrent.futures.TimeoutError
+    def map(self, func, tasks, timeout=None):
+        futures = [self.submit(func, *args) for args in tasks]
+        _, pending = wait(futures, timeout=timeout)
+        if len(pending) > 0:
+            raise TimeoutError()
+        return [future.result() for future in futures]
+
+    # 提交一批任务，deadline(time.time()的时刻)为这批任务的截止时刻，返回各任务的future，由gather取结果
+    def submitAll(self, func, tasks, deadline):
+        return [self.submit(func, *args, deadline=deadline) for args in tasks]
+
+    # 等待一批任务到deadline，没有按时完成的任务结果为None，尚未开始的任务被取消，正在进行的求解到deadline时停止，
+    # 结果不再使用；子进程中出错的任务结果也为None，由调用方使用后备轨迹
+    def gather(self, futures, deadline):
+        wait(futures, timeout=max(0., deadline - time.time()))
+        results = []
+        for future in futures:
+            if not future.done():
+                future.cancel()
+                results.append(None)
+            elif future.exception() is not None:
+                print("solve task failed: {!r}".format(future.exception()))
+                results.append(None)
+            else:
+                results.append(future.result())
+        return results
+
+    # 提交一批任务并等待到deadline，结果与gather相同
+    def mapUntil(self, func, tasks, deadline):
+        return self.gather(self.submitAll(func, tasks, deadline), deadline)
+
+    # 关闭进程池，wait为False时丢弃尚未开始的任务并结束子进程，正在进行的求解不再等待
+    def shutdown(self, wait=True):
+        # 子进程须在shutdown之前取出，shutdown(wait=False)之后解释器退出时仍会等待子进程完成当前任务
+        processes = [process for process in multiprocessing.active_children() if process.pid in self.pids]
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        if not wait:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 飞行遥测日志，定长记录按块交给后台线程追加写入二进制文件，内存占用不随飞行时长增长
+import threading
+import queue
+import json
+import numpy as np
+
+# 每条记录为一架无人机一个周期的数据
+recordType = np.dtype([
+    ('time', np.float64),
+    ('Id', np.int32),
+    ('actual', np.float64, 3),
+    ('desired', np.float64, 3),
+    ('command', np.float64, 3),
+    ('yaw', np.float64),
+    ('yawRate', np.float64)
+])
+
+# 读取日志文件，按记录类型直接映射，不需要解析
+def loadTelemetry(path):
+    return np.memmap(path, dtype=recordType, mode='r')
+
+# 导出为原来的origin.txt格式，即按记录顺序的[{"id": Id, "position": [x, y, z]}]，供原有的分析脚本使用
+def exportOrigin(path, originPath="origin.txt"):
+    records = loadTelemetry(path)
+    with open(originPath, "w") as f:
+        f.write(json.dumps([
+            {"id": int(Id), "position": position}
+            for Id, position in zip(records['Id'], records['actual'].tolist())
+        ]))
+
+class TelemetryLogger:
+    # chunkSize为每块的记录数，bufferNum为循环使用的块数
+    def __init__(self, path, chunkSize=1024, bufferNum=4):
+        self.file = open(path, "wb")
+        self.chunkSize = chunkSize
+        self.free = queue.Queue()
+        for _ in range(bufferNum):
+            self.free.put(np.zeros(chunkSize, dtype=recordType))
+        # 待写入的(块, 记录数)，None表示结束
+        self.pending = queue.Queue()
+        self.chunk = self.free.get()
+        self.count = 0
+        # 写入跟不上时丢弃的块数，记录不阻塞控制线程
+        self.dropped = 0
+        self.writer = threading.Thread(target=self.__write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    # 后台线程写入文件，写完的块放回空闲队列
+    def __write(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            chunk, count = item
+            self.file.write(chunk[:count].tobytes())
+            self.free.put(chunk)
+        self.file.flush()
+
+    # 记录一个周期内多架无人机的数据，除time外均为按无人机排列的数组
+    def log(self, time, Ids, actual, desired, command, yaw, yawRate):
+        num = len(Ids)
+        start = 0
+        while start < num:
+            size = min(num - start, self.chunkSize - self.count)
+            records = self.chunk[self.count:self.count + size]
+            records['time'] = time
+            records['Id'] = Ids[start:start + size]
+            records['actual'] = actual[start:start + size]
+            records['desired'] = desired[start:start + size]
+            records['command'] = command[start:start + size]
+            records['yaw'] = yaw[start:start + size]
+            records['yawRate'] = yawRate[start:start + size]
+            self.count += size
+            start += size
+            if self.count == self.chunkSize:
+                self.__submit()
+
+    # 当前块交给后台线程，换一块空闲的继续记录；没有空闲块时丢弃当前块的记录，覆盖写入
+    def __submit(self):
+        try:
+            chunk = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            self.count = 0
+            return
+        self.pending.put((self.chunk, self.count))
+        self.chunk = chunk
+        self.count = 0
+
+    # 写入剩余记录并关闭文件
+    def close(self):
+        if self.count > 0:
+            self.pending.put((self.chunk, self.count))
+            self.count = 0
+        self.pending.put(None)
+        self.writer.join()
+        self.file.close()
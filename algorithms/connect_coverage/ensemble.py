@@ -0,0 +1,200 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 多组相互独立的无人机群同时仿真，状态数组带有前置的组维度(E, n)，每个时刻对所有组一次性计算
+import time
+import numpy as np
+
+import algorithms.connect_coverage.worker as worker
+from algorithms.connect_coverage.worker import Status, statusTransition, backControl
+
+class Ensemble:
+    # positions为(E, n, 2)的初始位置，broken为(E, n)或(n,)的布尔数组，表示超过一半时长后会损坏的无人机
+    # record为True时保存位置、角度、状态和连通度的历史数据
+    def __init__(self, positions, dt, broken=None, record=True):
+        # 参数在创建时从worker读取，可先用worker.configure修改
+        self.radius = worker.R
+        self.delta = worker.delta
+        self.epsilon = worker.epsilon
+        self.vMax = worker.vMax
+
+        self.positions = np.array(positions, dtype=float)
+        self.E, self.n = self.positions.shape[0:2]
+        self.dt = dt
+        self.epoch = 0
+        self.epochNum = int(np.floor(worker.totalTime / dt))
+        self.record = record
+
+        if broken is None:
+            broken = np.isin(np.arange(self.n), worker.brokenIndex)
+        self.broken = np.broadcast_to(broken, (self.E, self.n))
+        # 各无人机出发时刻和返回方向，各组相同
+        self.startEpoch = np.arange(self.n) * worker.interval / dt
+        self.odd = np.arange(self.n) % 2 == 1
+
+        self.status = np.full((self.E, self.n), Status.Stay.value, dtype=np.int8)
+        self.angles = self.__angles(self.positions)
+        # 上一时刻的覆盖控制量和速度朝向
+        self.ueY = np.zeros((self.E, self.n))
+        self.veAngle = np.zeros((self.E, self.n))
+        self.lambdaMin = np.full(self.E, np.inf)
+
+        if record:
+            shape = (self.E, self.n, self.epochNum)
+            self.Px_h = np.zeros(shape)
+            self.Py_h = np.zeros(shape)
+            self.Angle_h = np.zeros(shape)
+            self.status_h = np.zeros(shape, dtype=np.int8)
+            self.lambda_h = np.zeros((self.E, self.epochNum))
+            self.Px_h[:, :, 0] = self.positions[:, :, 0]
+            self.Py_h[:, :, 0] = self.positions[:, :, 1]
+            self.Angle_h[:, :, 0] = self.angles
+
+    # 相对雷达中心的方位角
+    def __angles(self, positions):
+        return np.pi + np.arctan((worker.circleY - positions[..., 1]) / (worker.circleX - positions[..., 0]))
+
+    # 各组的距离矩阵和只包含覆盖状态无人机的邻接矩阵、拉普拉斯矩阵
+    def __L_Mat(self, positions, active):
+        value = -(self.radius**2/np.log(self.delta))
+        d = np.linalg.norm(positions[:, :, np.newaxis, :] - positions[:, np.newaxis, :, :], axis=-1)
+        pair = active[:, :, np.newaxis] & active[:, np.newaxis, :] & ~np.eye(self.n, dtype=bool)
+        A = np.where(pair & (d <= self.radius), np.exp(-d**2/value), 0)
+        L = -A
+        # 不参与覆盖的无人机在对角线上加一个大于所有拉普拉斯特征值的常数，使其不影响最小的两个特征值
+        diagonal = np.where(active, A.sum(axis=2), 2. * self.n)
+        L[:, np.arange(self.n), np.arange(self.n)] = diagonal
+        return L, A, d
+
+    # 批量求解各组的代数连通度和Fiedler向量
+    def __fiedler(self, L):
+        values, vectors = np.linalg.eigh(L)
+        return values[:, 1], vectors[:, :, 1]
+
+    # 覆盖控制律，与Func.ccangle相同，邻居只包括同组中参与覆盖的无人机
+    def __ccangle(self, positions, angles, ueHisY, agentAngles, d, active):
+        angleStart, angleEnd, cov = worker.angleStart, worker.angleEnd, worker.cov
+        bestAngle = np.zeros(angles.shape)
+        bestAngle[angles < angleStart] = angleStart + cov / 2
+        bestAngle[angles > angleEnd] = angleEnd - cov / 2
+
+        # 邻居朝向角(包括自身，非邻居为nan)，末尾加上两个限定角度
+        neighbor = (d <= self.radius) & active[:, np.newaxis, :]
+        candidate = np.concatenate([
+            np.where(neighbor, angles[:, np.newaxis, :], np.nan),
+            np.broadcast_to([angleStart, angleEnd], angles.shape + (2,))
+        ], axis=2)
+        own = angles[:, :, np.newaxis]
+        below = np.where(candidate < own, candidate, -np.inf).max(axis=2)
+        above = np.where(candidate > own, candidate, np.inf).min(axis=2)
+        equal = np.sum(candidate == own, axis=2)
+        lower = np.where(below > -np.inf, below, np.nanmax(candidate, axis=2))
+        upper = np.where(equal >= 2, angles, above)
+        free = bestAngle == 0
+        bestAngle[free] = ((lower + upper) / 2)[free]
+
+        # 影响程度受距离的影响，距离雷达越近，通常的影响越小
+        beta = 0.1
+        gamma = 0.01
+        gradient = (gamma - beta) / (worker.positionEnd - worker.positionStart)
+        intercept = beta - worker.positionStart * gradient
+        alpha = gradient * positions[:, :, 0] + intercept
+
+        # 相同和相反运动趋势
+        sameTrend = ueHisY * (angles - bestAngle) >= 0
+        ue = np.where(sameTrend, ueHisY, -ueHisY) + alpha * (angles - bestAngle)
+        ue = np.sign(ue) * np.minimum(np.abs(ue), self.vMax)
+
+        # 保证无人机相邻时刻转角的幅度在pi/30之内
+        angleChange = np.abs(np.arctan(ue/self.vMax) - agentAngles) > np.pi / 30
+        newAngle = agentAngles + np.sign(angles - bestAngle) * np.pi / 30
+        ue = np.where(angleChange, self.vMax * np.tan(newAngle), ue)
+
+        # 保证无人机速度范围在-pi/3 ~ pi/3
+        ue = np.where(np.arctan(ue / self.vMax) < -np.pi / 3, self.vMax * np.tan(-np.pi / 3), ue)
+        ue = np.where(np.arctan(ue / self.vMax) > np.pi / 3, self.vMax * np.tan(np.pi / 3), ue)
+        return ue
+
+    # 连通保持控制律，与Func.con_pre相同，features为各组的代数连通度
+    def __con_pre(self, features, featureVec, positions, d, A):
+        value = -(self.radius**2/np.log(self.delta))/2
+        a1 = np.full(features.shape, -50000.)
+        larger = features > self.epsilon
+        a1[larger] = -10/(np.sinh(features[larger] - self.epsilon) ** 2)
+
+        # A中已去除自身和不参与覆盖的无人机
+        weight = -A/value*(featureVec[:, :, np.newaxis] - featureVec[:, np.newaxis, :])**2
+        a2 = weight.sum(axis=2)[:, :, np.newaxis]*positions - weight @ positions
+        return -a1[:, np.newaxis, np.newaxis]*a2
+
+    def updateStatus(self):
+        self.status = statusTransition(
+            self.status, self.positions[:, :, 0], self.positions[:, :, 1],
+            self.epoch, self.epochNum, self.startEpoch, self.broken)
+
+    def inControl(self):
+        epoch = self.epoch
+        vMax = self.vMax
+        active = self.status == Status.Cover.value
+
+        u_hx = np.where(active, vMax, 0.)
+        u_hy = np.zeros((self.E, self.n))
+        ue_hy = np.zeros((self.E, self.n))
+        veAngle = np.zeros((self.E, self.n))
+
+        # 只计算至少两架无人机参与覆盖的组，其余组参与覆盖的无人机直接前行
+        group = np.where(active.sum(axis=1) >= 2)[0]
+        if len(group) > 0:
+            positions = self.positions[group]
+            cover = active[group]
+            L, A, d = self.__L_Mat(positions, cover)
+            value, vector = self.__fiedler(L)
+            self.lambdaMin[group] = np.minimum(self.lambdaMin[group], value)
+            if self.record:
+                self.lambda_h[group, epoch] = value
+
+            ue = self.__ccangle(positions, self.angles[group], self.ueY[group], self.veAngle[group], d, cover)
+            uc = self.__con_pre(value, vector, positions, d, A)
+
+            uc[:, :, 1] = 10 * uc[:, :, 1]
+            # 限幅
+            dist = np.linalg.norm(uc, axis=2)
+            over = dist > vMax
+            uc[over] = vMax * uc[over] / dist[over, np.newaxis]
+
+            # 防止倒飞
+            u_y = np.where(ue * (uc[:, :, 1] + ue) < 0, ue, uc[:, :, 1] + ue)
+
+            u_hy[group] = np.where(cover, u_y, 0)
+            ue_hy[group] = np.where(cover, ue, 0)
+            veAngle[group] = np.where(cover, np.arctan(u_y / vMax), 0)
+
+        # 返回状态的无人机
+        back = self.status == Status.Back.value
+        ux, uy, angle = backControl(self.status, self.positions[:, :, 0], self.positions[:, :, 1], self.odd)
+        u_hx = np.where(back, ux, u_hx)
+        u_hy = np.where(back, uy, u_hy)
+        veAngle = np.where(back, angle, veAngle)
+
+        self.ueY = ue_hy
+        self.veAngle = veAngle
+
+        # 更新无人机位置
+        self.positions[:, :, 0] += u_hx * self.dt
+        self.positions[:, :, 1] += u_hy * self.dt
+        self.angles = self.__angles(self.positions)
+
+        if self.record:
+            self.status_h[:, :, epoch] = self.status
+            self.Px_h[:, :, epoch + 1] = self.positions[:, :, 0]
+            self.Py_h[:, :, epoch + 1] = self.positions[:, :, 1]
+            self.Angle_h[:, :, epoch + 1] = self.angles
+
+    # 运行完整个仿真，返回每秒计算的无人机步数
+    def run(self):
+        start = time.time()
+        while self.epoch < self.epochNum-1:
+            self.updateStatus()
+            self.inControl()
+            self.epoch += 1
+        self.consume = time.time() - start
+        return self.E * self.n * (self.epochNum - 1) / self.consume
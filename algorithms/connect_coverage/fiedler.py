@@ -0,0 +1,44 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+import numpy as np
+from scipy.linalg import eigh
+from scipy.sparse import issparse, diags
+from scipy.sparse.linalg import lobpcg
+
+class Fiedler:
+    # threshold: 智能体数目小于该值时使用稠密eigh，否则使用稀疏LOBPCG，默认值为devTools/benchFiedler.py测得的交叉点
+    # tol, maxiter: LOBPCG的收敛精度和最大迭代次数
+    def __init__(self, threshold=1000, tol=1e-8, maxiter=200):
+        self.threshold = threshold
+        self.tol = tol
+        self.maxiter = maxiter
+        # 上一时刻的Fiedler向量，用于LOBPCG热启动和保持向量方向，稠密eigh直接求解，没有初值
+        self.vector = None
+
+    # 只计算代数连通度(第二小特征值)和对应的Fiedler向量
+    def update(self, L):
+        n = L.shape[0]
+        if n < self.threshold:
+            dense = L.toarray() if issparse(L) else L
+            # 对称矩阵只求最小的两个特征值
+            values, vectors = eigh(dense, subset_by_index=[0, 1])
+            value, vector = values[1], vectors[:, 1]
+        else:
+            # 智能体数目不变时用上一时刻的向量作为初值
+            if self.vector is not None and len(self.vector) == n:
+                init = self.vector.reshape(n, 1)
+            else:
+                init = np.random.rand(n, 1)
+            # 拉普拉斯矩阵的最小特征向量为全1向量，在其正交补空间内求最小特征值
+            ones = np.ones((n, 1)) / np.sqrt(n)
+            # 以度数的倒数作为预条件，孤立点的度数按1处理
+            degree = L.diagonal()
+            M = diags(1.0 / np.where(degree > 0, degree, 1.0))
+            values, vectors = lobpcg(L, init, Y=ones, M=M, largest=False, tol=self.tol, maxiter=self.maxiter)
+            value, vector = values[0], vectors[:, 0]
+
+        # 保持与上一时刻方向一致
+        if self.vector is not None and len(self.vector) == n and np.dot(vector, self.vector) < 0:
+            vector = -vector
+        self.vector = vector
+        return value, vector
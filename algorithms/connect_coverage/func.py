@@ -2,9 +2,11 @@
 #!/usr/bin/env python
 import numpy as np
 from scipy.spatial.distance import pdist, squareform
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix, diags, issparse
 
 class Func:
-    def __init__(self, positionStart, positionEnd, angleStart, angleEnd, radius, vMax, cov, delta, epsilon):
+    def __init__(self, positionStart, positionEnd, angleStart, angleEnd, radius, vMax, cov, delta, epsilon, sparse=False):
         self.positionStart = positionStart
         self.positionEnd = positionEnd
         self.angleStart = angleStart
@@ -14,6 +16,10 @@ class Func:
         self.cov = cov
         self.delta = delta
         self.epsilon = epsilon
+        # 使用稀疏矩阵，只计算通信范围内的点对，通信半径相对场地较小时更快
+        self.sparse = sparse
+        # 各智能体数目下所有智能体对的下标，稠密模式计算覆盖控制律时使用
+        self.pairs = {}
 
 
     # agentPos: 智能体位置信息，第一列x，第二列y
@@ -29,7 +35,6 @@ class Func:
     def ccangle(self, agentPos, angles, ueHisY, agentAngles):
         # 智能体数目
         n = agentPos.shape[0]
-        ue = np.zeros(n)
         bestAngle = np.zeros(n)
 
         # 限制智能体角度范围
@@ -38,22 +43,40 @@ class Func:
         bestAngle[lessIndex] = self.angleStart + self.cov / 2
         bestAngle[largerIndex] = self.angleEnd - self.cov / 2
 
-        # 得到距离矩阵
-        distMatrix = squareform(pdist(agentPos, 'euclidean'))
-
         # 未赋值，说明智能体角度在限制范围内
-        for index, value in enumerate(bestAngle):
-            if value == 0:
-                # 获取邻居距离
-                distConnected = distMatrix[index, :]
-                connectedIndex = np.where(distConnected <= self.radius)[0]
-                # print(angles)
-                # 取出邻居朝向角
-                angleList = [self.angleStart, self.angleEnd] + angles[connectedIndex].tolist()
-                angleList = np.array(sorted(angleList))
-
-                indexPos = np.where(angleList == angles[index])[0][0]
-                bestAngle[index] = (angleList[indexPos - 1] + angleList[indexPos + 1]) / 2
+        free = bestAngle == 0
+        if free.any():
+            # 通信范围内的智能体对(i, j)，i < j
+            if self.sparse:
+                # KD树按稍大的半径找出候选点对，不计算完整的距离矩阵，再与pdist相同先求平方和再开方筛选
+                pairs = cKDTree(agentPos).query_pairs(self.radius * (1 + 1e-9), output_type='ndarray')
+                first, second = pairs[:, 0], pairs[:, 1]
+                near = np.sqrt(np.sum((agentPos[first] - agentPos[second]) ** 2, axis=1)) <= self.radius
+            else:
+                if n not in self.pairs:
+                    self.pairs[n] = np.triu_indices(n, 1)
+                first, second = self.pairs[n]
+                near = pdist(agentPos, 'euclidean') <= self.radius
+            first, second = first[near], second[near]
+            # 每个智能体的候选角度为各邻居、自身和两个限定角度
+            index = np.arange(n)
+            rows = np.concatenate([first, second, index, index, index])
+            candidate = np.concatenate([angles[second], angles[first], angles,
+                np.full(n, self.angleStart), np.full(n, self.angleEnd)])
+            own = angles[rows]
+            smaller, larger = candidate < own, candidate > own
+            # 排序后自身的前一个角度、后一个角度、候选中的最大角度和与自身相同的角度个数
+            below = np.full(n, -np.inf)
+            above = np.full(n, np.inf)
+            highest = np.full(n, -np.inf)
+            np.maximum.at(below, rows[smaller], candidate[smaller])
+            np.minimum.at(above, rows[larger], candidate[larger])
+            np.maximum.at(highest, rows, candidate)
+            equal = np.bincount(rows[candidate == own], minlength=n)
+            # 自身最小时与原实现一样取到列表末尾的最大值，存在相同角度时取到的是相同的角度
+            lower = np.where(below > -np.inf, below, highest)
+            upper = np.where(equal >= 2, angles, above)
+            bestAngle[free] = ((lower + upper) / 2)[free]
         # 影响程度受距离的影响，距离雷达越近，通常的影响越小
         beta = 0.1
         gamma = 0.01
@@ -61,46 +84,46 @@ class Func:
         intercept = beta - self.positionStart * gradient
 
         alpha = gradient * agentPos[:, 0] + intercept
-        sameTrendIndex = ueHisY * (angles - bestAngle) >= 0
-
-        ue[sameTrendIndex] = ueHisY[sameTrendIndex] + alpha[sameTrendIndex] * (angles[sameTrendIndex] - bestAngle[sameTrendIndex])
-        # 相反运动趋势
-        ue[~sameTrendIndex] = -ueHisY[~sameTrendIndex] + alpha[~sameTrendIndex] * (angles[~sameTrendIndex] - bestAngle[~sameTrendIndex])
-        temp = np.abs(ue)
+        deviation = angles - bestAngle
+        # 运动趋势相同时沿用历史控制量，相反时取反
+        sameTrendIndex = ueHisY * deviation >= 0
+        ue = np.where(sameTrendIndex, ueHisY, -ueHisY) + alpha * deviation
         # 取最小值
-        temp[temp > self.vMax] = self.vMax
-        ue = np.sign(ue) * temp
-        # print(ue[:, 1])
+        ue = np.sign(ue) * np.minimum(np.abs(ue), self.vMax)
 
         # 保证无人机相邻时刻转角的幅度在pi/12之内
         angleChangeIndex = np.abs(np.arctan(ue/self.vMax) - agentAngles) > np.pi / 30
-        # 符合条件
-        newAngle = agentAngles[angleChangeIndex] + np.sign(angles[angleChangeIndex] - bestAngle[angleChangeIndex]) * np.pi / 30
-        ue[angleChangeIndex] = self.vMax * np.tan(newAngle)
+        newAngle = agentAngles + np.sign(deviation) * np.pi / 30
+        ue = np.where(angleChangeIndex, self.vMax * np.tan(newAngle), ue)
 
         # 保证无人机速度范围在-pi/3 ~ pi/3
-        lessIndex = np.arctan(ue / self.vMax) < -np.pi / 3
-        largerIndex = np.arctan(ue / self.vMax) > np.pi / 3
-
-        ue[lessIndex] = self.vMax * np.tan(-np.pi / 3)
-        ue[largerIndex] = self.vMax * np.tan(np.pi / 3)
+        turn = np.arctan(ue / self.vMax)
+        ue = np.where(turn < -np.pi / 3, self.vMax * np.tan(-np.pi / 3), ue)
+        ue = np.where(turn > np.pi / 3, self.vMax * np.tan(np.pi / 3), ue)
         return ue
 
     # 定义计算拉普拉斯矩阵的函数
     # 输入：x为N*n的状态矩阵，N为智能体数量，n为状态维度；R为通信范围
     # 输出：n*n的拉普拉斯矩阵L，邻接矩阵A，距离矩阵d
+    # 稀疏模式下三者均为scipy.sparse矩阵，d只储存通信范围内的距离
     def L_Mat(self, X):
         value = -(self.radius**2/np.log(self.delta))
-        d = squareform(pdist(X, 'euclidean'))
         N = X.shape[0]
-        A = np.zeros((N, N))
-        for i in range(N):
-            for j in range(i):
-                if(d[i, j] <= self.radius):
-                    A[i, j] = np.exp(-d[i, j]**2/value)
-                else:
-                    A[i, j] = 0
-                A[j, i] = A[i, j]
+
+        if self.sparse:
+            # 通过KD树找出通信范围内的点对，不计算完整的距离矩阵
+            pairs = cKDTree(X).query_pairs(self.radius, output_type='ndarray')
+            dist = np.linalg.norm(X[pairs[:, 0]] - X[pairs[:, 1]], axis=1)
+            rows = np.concatenate([pairs[:, 0], pairs[:, 1]])
+            cols = np.concatenate([pairs[:, 1], pairs[:, 0]])
+            d = coo_matrix((np.concatenate([dist, dist]), (rows, cols)), shape=(N, N)).tocsr()
+            A = coo_matrix((np.exp(-np.concatenate([dist, dist])**2/value), (rows, cols)), shape=(N, N)).tocsr()
+            L = diags(np.asarray(A.sum(axis=1)).flatten()) - A
+            return L.tocsr(), A, d
+
+        d = squareform(pdist(X, 'euclidean'))
+        A = np.where(d <= self.radius, np.exp(-d**2/value), 0)
+        np.fill_diagonal(A, 0)
 
         D = np.diag(np.sum(A, axis=1))
         L = D-A
@@ -118,25 +141,29 @@ class Func:
         '''
         n = positions.shape[0]
         value = -(self.radius**2/np.log(self.delta))/2
-        uc = np.zeros((n, 2))
-        for i in range(n):
-            if features[i] <= self.epsilon:
-                a1 = -50000
-            else:
-                a1 = -10/(np.sinh(features[i] - self.epsilon) ** 2)
-
-            a2x, a2y = 0, 0
-            # 将距离矩阵取出，并删除自己
-            distConnected = distMatrix[i, :]
-            connectedIndex = np.where(distConnected <= self.radius)[0]
-            connectedIndex = np.delete(connectedIndex, connectedIndex == i)
-
-            for agent in connectedIndex:
-                a2x += (-(A[i, agent])/value)*(positions[i, 0] - positions[agent, 0])*((featureVec[i]-featureVec[agent])**2)
-                a2y += (-(A[i, agent])/value)*(positions[i, 1] - positions[agent, 1])*((featureVec[i]-featureVec[agent])**2)
-
-            ucx = -a1*a2x
-            ucy = -a1*a2y
 
-            uc[i, :] = np.array([ucx, ucy])
+        features = np.asarray(features)
+        a1 = np.full(n, -50000.)
+        larger = features > self.epsilon
+        a1[larger] = -10/(np.sinh(features[larger] - self.epsilon) ** 2)
+
+        # 所有邻居对(i, j)，按i、j从小到大排列，与逐个累加的顺序一致
+        if issparse(distMatrix):
+            # 稀疏距离矩阵只储存了通信范围内的邻居，邻接矩阵与其非零结构相同
+            pairs = distMatrix.tocoo()
+            order = np.lexsort((pairs.col, pairs.row))
+            rows, cols = pairs.row[order], pairs.col[order]
+            weight = -(A.tocoo().data[order])/value
+        else:
+            # 删除自己
+            connected = distMatrix <= self.radius
+            np.fill_diagonal(connected, False)
+            rows, cols = np.nonzero(connected)
+            weight = -(A[rows, cols])/value
+
+        terms = weight[:, np.newaxis]*(positions[rows] - positions[cols])*((featureVec[rows]-featureVec[cols])**2)[:, np.newaxis]
+        a2 = np.zeros((n, 2))
+        np.add.at(a2, rows, terms)
+
+        uc = -a1[:, np.newaxis]*a2
         return uc
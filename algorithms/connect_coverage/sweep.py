@@ -0,0 +1,136 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 连通保持覆盖的参数扫描，每组参数在进程池中独立运行一次完整仿真
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import itertools
+import json
+import os
+import time
+import numpy as np
+
+import algorithms.connect_coverage.worker as worker
+
+# 未指定的参数使用worker中的默认值，避免进程复用时沿用上一组参数
+defaultParams = {name: getattr(worker, name) for name in worker.tunableNames}
+metricNames = ("minLambda", "disconnected", "coverage", "coverTime", "failed", "consume")
+
+# 网格扫描，space为{参数名: 取值列表}
+def gridParams(space):
+    names = list(space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+# 随机采样，space中元组(下限, 上限)均匀采样，列表则随机选取其中一项
+def randomParams(space, num, seed=None):
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(num):
+        params = {}
+        for name, value in space.items():
+            if isinstance(value, tuple):
+                params[name] = float(rng.uniform(*value))
+            else:
+                params[name] = value[rng.integers(len(value))]
+        samples.append(params)
+    return samples
+
+# 各时刻扇面被覆盖的比例，扇面离散为bins段，只统计处于覆盖状态的无人机
+def sectorCoverage(Angle_h, status_h, bins=300):
+    edges = np.linspace(worker.angleStart, worker.angleEnd, bins + 1)
+    centers = (edges[:-1] + edges[1:]) / 2
+    covering = status_h == worker.Status.Cover.value
+    inArc = np.abs(centers[:, np.newaxis, np.newaxis] - Angle_h[np.newaxis]) <= worker.cov / 2
+    return np.mean(np.any(inArc & covering[np.newaxis], axis=1), axis=0)
+
+# 运行一组参数并统计指标，coverThreshold为认为扇面已被覆盖的比例
+def runConfig(params, allCrazyFlies, dt, coverThreshold=0.9):
+    start = time.time()
+    worker.configure(**dict(defaultParams, **params))
+    process = worker.Workers('sweep', None, allCrazyFlies, dt, verbose=False)
+    process.run()
+
+    coverage = sectorCoverage(process.Angle_h, process.status_h)
+    # 至少两架无人机参与覆盖的时刻才计算了连通度
+    connected = np.sum(process.status_h == worker.Status.Cover.value, axis=0) >= 2
+    lambdas = process.lambda_h[connected]
+    reached = np.where(coverage >= coverThreshold)[0]
+
+    return {
+        "minLambda": float(lambdas.min()) if len(lambdas) else np.nan,
+        "disconnected": int(np.sum(lambdas < worker.epsilon)),
+        "coverage": float(coverage.mean()),
+        "coverTime": float(reached[0] * dt) if len(reached) else np.nan,
+        "failed": int(process.failed),
+        "consume": time.time() - start
+    }
+
+class Sweep:
+    # path为结果文件(.npz)，同目录下path + ".part"为逐条追加的断点记录
+    def __init__(self, allCrazyFlies, dt, path, processNum=None, coverThreshold=0.9):
+        self.allCrazyFlies = allCrazyFlies
+        self.dt = dt
+        self.path = path
+        self.checkpoint = path + ".part"
+        self.processNum = processNum or multiprocessing.cpu_count()
+        self.coverThreshold = coverThreshold
+
+    # 参数组的唯一标识，用于断点续跑时判断是否已完成
+    def __key(self, params):
+        return json.dumps(params, sort_keys=True)
+
+    # 读取已完成的记录
+    def __load(self):
+        records = {}
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint, "r") as f:
+                for line in f:
+                    # 中断时最后一行可能不完整
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    records[self.__key(record["params"])] = record
+        return records
+
+    # 按列整理所有记录，列表类型的参数保存为json字符串
+    def __save(self, records):
+        names = sorted(set(name for record in records for name in record["params"]))
+        columns = {}
+        for name in names:
+            values = [record["params"].get(name, defaultParams[name]) for record in records]
+            if all(isinstance(value, (int, float)) for value in values):
+                columns[name] = np.array(values, dtype=float)
+            else:
+                columns[name] = np.array([json.dumps(value) for value in values])
+        for name in metricNames:
+            columns[name] = np.array([record["metrics"][name] for record in records], dtype=float)
+        np.savez(self.path, **columns)
+
+    # 运行所有参数组，已在断点记录中的参数组直接跳过，返回按输入顺序排列的记录
+    def run(self, paramList):
+        records = self.__load()
+        todo = [params for params in paramList if self.__key(params) not in records]
+        print("{} configurations, {} done, {} to run".format(len(paramList), len(paramList) - len(todo), len(todo)))
+
+        with ProcessPoolExecutor(max_workers=self.processNum) as executor, open(self.checkpoint, "a") as f:
+            futures = {
+                executor.submit(runConfig, params, self.allCrazyFlies, self.dt, self.coverThreshold): params
+                for params in todo
+            }
+            for counter, future in enumerate(as_completed(futures)):
+                params = futures[future]
+                # 参数不合法等异常同样记为失败
+                try:
+                    metrics = future.result()
+                except Exception as e:
+                    print("configuration {} failed: {}".format(params, e))
+                    metrics = dict({name: np.nan for name in metricNames}, failed=1)
+                record = {"params": params, "metrics": metrics}
+                records[self.__key(params)] = record
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                print("progress: {}/{}".format(counter + 1, len(todo)))
+
+        results = [records[self.__key(params)] for params in paramList]
+        self.__save(results)
+        return results
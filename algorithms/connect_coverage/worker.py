@@ -1,12 +1,15 @@
 # -*- coding: UTF-8 -*-
 #!/usr/bin/env python
-from multiprocessing import Process
+from multiprocessing import Process, shared_memory
 import numpy as np
+import os
 from enum import Enum
 import traceback # 错误堆栈
 
 # 自定义库
 from algorithms.connect_coverage.func import Func
+from algorithms.connect_coverage.fiedler import Fiedler
+from algorithms.fleetState import FleetState
 
 # 参数配置
 r = 2.0 # 雷达半径
@@ -26,33 +29,120 @@ vMax = 0.2  # 连通保持最大速度（用于限幅）
 vBack = 0.3 # 无人机返回速度
 totalTime = 100  # 仿真总时长
 brokenIndex = [1, 5]
+sparse = False # 是否使用稀疏拉普拉斯矩阵，通信半径相对场地较小时更快
+
+# 参数扫描时可修改的参数，需在创建Workers之前修改
+tunableNames = ("R", "delta", "epsilon", "vMax", "interval", "brokenIndex", "totalTime", "sparse")
+
+# 修改本进程内的参数设置，参数扫描时在各子进程中分别调用
+def configure(**params):
+    for name, value in params.items():
+        if name not in tunableNames:
+            raise KeyError("unknown parameter: {}".format(name))
+        globals()[name] = value
 
 # 无人机状态枚举
 Status = Enum("Status", ("Stay", "Cover", "Back", "Broken"))
 
+# 状态转移的数组形式，status为Status值组成的int8数组，Px、Py与其形状相同，可带有任意前置维度
+# startEpoch为各无人机的出发时刻，broken为超过一半时长后会损坏的无人机，每架无人机每个时刻只转移一次
+def statusTransition(status, Px, Py, epoch, epochNum, startEpoch, broken):
+    # 由静止开始覆盖任务
+    start = (status == Status.Stay.value) & (epoch >= startEpoch)
+    # 由覆盖开始返回
+    leave = (status == Status.Cover.value) & (Px > positionEnd)
+    # 已返回覆盖区域
+    arrive = (status == Status.Back.value) & (Px >= positionStart) & (Px <= positionEnd) & (Py < 2.0) & (Py > -2.0)
+    # 损坏
+    fail = (status == Status.Cover.value) & ~leave & (epoch > epochNum/2) & broken
+
+    newStatus = status.copy()
+    newStatus[start | leave] = Status.Back.value
+    newStatus[arrive] = Status.Cover.value
+    newStatus[fail] = Status.Broken.value
+    return newStatus
+
+# 返回状态的控制量，odd为奇数编号的无人机，从上方返回，偶数编号从下方返回
+# 返回(ux, uy, veAngle)，非返回状态或不满足任何条件的无人机控制量为0
+def backControl(status, Px, Py, odd):
+    back = status == Status.Back.value
+    up = back & odd
+    down = back & ~odd
+    # 按原判断顺序排列，取第一个满足的条件
+    conditions = [
+        up & (Px < positionStart) & (Py <= 1.0),
+        up & (Px < positionStart) & (Py >= 1.0),
+        up & (Px >= positionEnd) & (Py < 2.0),
+        up & (Px >= positionEnd) & (Py >= 2.0),
+        up & (Px >= positionStart) & (Py >= 2.0),
+        down & (Px < positionStart) & (Py >= -1.0),
+        down & (Px < positionStart) & (Py <= -1.0),
+        down & (Px >= positionEnd) & (Py > -2.0),
+        down & (Px >= positionEnd) & (Py < -2.0),
+        down & (Px > positionStart) & (Py <= -2.0)
+    ]
+    ux = np.select(conditions, [vBack, 0, 0, -vBack, -vBack, vBack, 0, 0, -vBack, -vBack], 0.)
+    uy = np.select(conditions, [0, -vBack, vBack, 0, 0, 0, vBack, -vBack, 0, 0], 0.)
+    veAngle = np.select(conditions, [0, -np.pi/2, np.pi/2, np.pi/2, np.pi, 0, -np.pi/2, np.pi/2, np.pi/2, np.pi], 0.)
+    return ux, uy, veAngle
+
+# 批量模式保存和共享内存传输的历史数据，lambda_h为一维，其余为(无人机, 时刻)
+historyNames = ("Px_h", "Py_h", "Angle_h", "u_hx", "u_hy", "lambda_h")
+
+# 在同一段内存上按顺序排列所有历史数据
+def historyViews(buffer, n, epochNum):
+    views = {}
+    offset = 0
+    for name in historyNames:
+        shape = (epochNum,) if name == "lambda_h" else (n, epochNum)
+        views[name] = np.ndarray(shape, dtype=np.float64, buffer=buffer, offset=offset)
+        offset += int(np.prod(shape)) * 8
+    return views
+
+def historySize(n, epochNum):
+    return ((len(historyNames) - 1) * n + 1) * epochNum * 8
+
 class Workers(Process):
-    def __init__(self, name, res, allCrazyFlies, dt):
+    # res为None时不对外发布，整个仿真在当前进程运行结束后用save保存历史数据
+    # shared为True时历史数据放在共享内存中，res只接收每chunkSize个时刻的(起始时刻, 结束时刻)通知
+    # 否则按原方式逐架无人机逐个时刻发布字典
+    def __init__(self, name, res, allCrazyFlies, dt, shared=False, chunkSize=10, verbose=True):
         Process.__init__(self)
         self.res = res
         self.name = name
         self.epoch = 0
         self.dt = dt
         self.epochNum = int(np.floor(totalTime / dt))
+        self.shared = shared
+        self.chunkSize = chunkSize
+        self.verbose = verbose
+        # 已通知的时刻，第0时刻为初始位置不发布
+        self.sentEpoch = 1
+        # 仿真过程中出现异常
+        self.failed = False
         self.getParams(allCrazyFlies)
         self.func = Func(positionStart, positionEnd, angleStart, angleEnd, 
-        R, vMax, cov, delta, epsilon)
+        R, vMax, cov, delta, epsilon, sparse)
+        # 代数连通度估计，只计算第二小特征值和Fiedler向量
+        self.fiedler = Fiedler()
 
-    # 从配置文件中解析无人机相关参数
+    # 从配置文件或FleetState中解析无人机相关参数
     def getParams(self, allCrazyFlies):
-        self.IdList = [item['Id'] for item in allCrazyFlies]
+        if not isinstance(allCrazyFlies, FleetState):
+            allCrazyFlies = FleetState(allCrazyFlies)
+        self.IdList = list(allCrazyFlies.IdList)
 
         self.n = len(self.IdList) # 无人机数量
 
-        # 批次无人机状态
-        self.flightStatus = [Status.Stay] * len(allCrazyFlies)
+        # 批次无人机状态，取Status的值
+        self.flightStatus = np.full(self.n, Status.Stay.value, dtype=np.int8)
+        # 各无人机开始飞行的时间节点、返回方向和是否会损坏
+        self.startEpoch = np.arange(self.n) * interval / self.dt
+        self.odd = np.arange(self.n) % 2 == 1
+        self.broken = np.isin(np.arange(self.n), brokenIndex)
 
         # 转换为numpy数组
-        self.positions = np.array([item['Position'] for item in allCrazyFlies])
+        self.positions = allCrazyFlies.positions.copy()
 
         # 计算角度信
         self.angles = np.pi + np.arctan((circleY - self.positions[:, 1]) / (circleX - self.positions[:, 0]))
@@ -61,23 +151,18 @@ class Workers(Process):
 
     # 更新损失和连通度
     def updateLossConn(self):
-        activate = np.array([True if status == Status.Cover else False for status in self.flightStatus])
+        activate = self.flightStatus == Status.Cover.value
         L, A, d = self.func.L_Mat(self.positions[activate, :])
 
-        value, vectors = np.linalg.eig(L)
-        # 从小到大对特征值进行排序
-        index = np.argsort(value)
-        self.vectors = vectors[:, index]
-        self.value = value[index]
-
-        # 第二小
-        self.lambda_h[self.epoch] = self.value[1]
+        # 第二小特征值及其特征向量
+        self.value, self.vector = self.fiedler.update(L)
+        self.lambda_h[self.epoch] = self.value
 
         self.L = L
         self.A = A
         self.d = d
 
-        print("时刻" + str(self.epoch)+ " 的连通度为" + str(self.value[1]))
+        self.verbose and print("时刻" + str(self.epoch)+ " 的连通度为" + str(self.value))
 
     # 用于初始化参数储存空间
     def storage_init(self):
@@ -98,6 +183,8 @@ class Workers(Process):
         u_hy = np.zeros(shape)
         veAngle_h = np.zeros(shape)
         lambda_h = np.zeros(self.epochNum)
+        # 各时刻的无人机状态，取Status的值，0表示未记录
+        status_h = np.zeros(shape, dtype=np.int8)
 
         # 首值初始化
         Px_h[:, 0] = self.positions[:, 0]
@@ -119,11 +206,44 @@ class Workers(Process):
         self.u_hy = u_hy
         self.veAngle_h = veAngle_h
         self.lambda_h = lambda_h
+        self.status_h = status_h
+
+        if self.shared:
+            # 共享内存在主进程中创建，初始值写入后改为共享内存上的视图
+            self.shm = shared_memory.SharedMemory(create=True, size=historySize(self.n, self.epochNum))
+            for name, view in historyViews(self.shm.buf, self.n, self.epochNum).items():
+                view[:] = getattr(self, name)
+            self.__mapShared()
+
+    # 历史数据指向共享内存，子进程以spawn方式启动时数组会被复制，需要重新指向
+    def __mapShared(self):
+        for name, view in historyViews(self.shm.buf, self.n, self.epochNum).items():
+            setattr(self, name, view)
+
+    # 保存历史数据，.npz结尾时保存为单个文件，否则保存为目录下的.npy文件，可用np.load(mmap_mode='r')读取
+    def save(self, path):
+        history = {name: getattr(self, name) for name in historyNames}
+        history["status_h"] = self.status_h
+        history["IdList"] = np.array(self.IdList)
+        history["dt"] = np.array(self.dt)
+        if path.endswith(".npz"):
+            np.savez(path, **history)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for name, value in history.items():
+                np.save(os.path.join(path, name + ".npy"), value)
+
+    # 释放共享内存，由创建共享内存的主进程在读取完毕后调用
+    def release(self):
+        if self.shared:
+            self.shm.close()
+            self.shm.unlink()
 
     def inControl(self):
         epoch = self.epoch
         # 判断无人机是否参与覆盖，参与赋值1，不参与覆盖
-        activate = np.array([True if status == Status.Cover else False for status in self.flightStatus])
+        activate = self.flightStatus == Status.Cover.value
+        self.status_h[:, epoch] = self.flightStatus
 
         # 初始化局部变量，避免频繁访问self造成时间成本过高
         veAngle = np.zeros(self.n)
@@ -150,16 +270,15 @@ class Workers(Process):
             ue_hy[activate] = ue[:]
 
             # 分段控制
-            features = np.ones(sum(activate)) * self.value[1]
-            featureVec = self.vectors[:, 1]
+            features = np.ones(sum(activate)) * self.value
+            featureVec = self.vector
             uc = self.func.con_pre(features, featureVec, self.positions[activate, :], self.d, self.A)
 
             uc[:, 1] = 10 * uc[:, 1]
             # 限幅
-            for index in range(uc.shape[0]):
-                dist = np.linalg.norm(uc[index, :])
-                if dist > vMax:
-                    uc[index, :] = vMax * uc[index, :] / dist
+            dist = np.linalg.norm(uc, axis=1)
+            over = dist > vMax
+            uc[over, :] = vMax * uc[over, :] / dist[over, np.newaxis]
 
             uc_hx[activate] = uc[:, 0]
             uc_hy[activate] = uc[:, 1]
@@ -178,52 +297,12 @@ class Workers(Process):
 
             veAngle[activate] = np.real(np.arctan(u_hy[activate]/u_hx[activate]))
 
-        # 非覆盖任务的无人机控制量判断
-        for index, status in enumerate(self.flightStatus):
-            Px, Py = self.positions[index, :]
-            # 控制量为0，不更新任何信息
-            if status == Status.Stay:
-                pass
-            if index % 2 == 1 and status == Status.Back:
-                if Px < positionStart and Py <= 1.0:
-                    u_hx[index] = vBack
-                    u_hy[index] = 0
-                elif Px < positionStart and Py >= 1.0:
-                    u_hx[index] = 0
-                    u_hy[index] = -vBack
-                    veAngle[index] = -np.pi/2
-                elif Px >= positionEnd and Py < 2.0:
-                    u_hx[index] = 0
-                    u_hy[index] = vBack
-                    veAngle[index] = np.pi/2
-                elif Px >= positionEnd and Py >= 2.0:
-                    u_hx[index] = -vBack
-                    u_hy[index] = 0
-                    veAngle[index] = np.pi/2
-                elif Px >= positionStart and Py >= 2.0:
-                    u_hx[index] = -vBack
-                    u_hy[index] = 0
-                    veAngle[index] = np.pi
-            elif index % 2 == 0 and status == Status.Back:
-                if Px < positionStart and Py >= -1.0:
-                    u_hx[index] = vBack
-                    u_hy[index] = 0
-                elif Px < positionStart and Py <= -1.0:
-                    u_hx[index] = 0
-                    u_hy[index] = vBack
-                    veAngle[index] = -np.pi/2
-                elif Px >= positionEnd and Py > -2.0:
-                    u_hx[index] = 0
-                    u_hy[index] = -vBack
-                    veAngle[index] = np.pi/2
-                elif Px >= positionEnd and Py < -2.0:
-                    u_hx[index] = -vBack
-                    u_hy[index] = 0
-                    veAngle[index] = np.pi/2
-                elif Px > positionStart and Py <= -2.0:
-                    u_hx[index] = -vBack
-                    u_hy[index] = 0
-                    veAngle[index] = np.pi
+        # 返回状态的无人机控制量，静止和损坏的无人机控制量为0
+        back = self.flightStatus == Status.Back.value
+        ux, uy, angle = backControl(self.flightStatus, self.positions[:, 0], self.positions[:, 1], self.odd)
+        u_hx[back] = ux[back]
+        u_hy[back] = uy[back]
+        veAngle[back] = angle[back]
 
         # 更新历史记录
         self.uc_hy[:, epoch + 1] = uc_hy
@@ -243,6 +322,17 @@ class Workers(Process):
         self.positions[:, 0] = self.Px_h[:, epoch + 1]
         self.positions[:, 1] = self.Py_h[:, epoch + 1]
 
+        # 不对外发布
+        if self.res is None:
+            return
+
+        # 数据已写入共享内存，每chunkSize个时刻通知一次可读取的时刻范围
+        if self.shared:
+            if epoch + 2 - self.sentEpoch >= self.chunkSize or epoch + 2 == self.epochNum:
+                self.res.put((self.sentEpoch, epoch + 2))
+                self.sentEpoch = epoch + 2
+            return
+
         # 发布对应无人机执行情况
         for k in range(self.n):
             Px, Py = self.positions[k, :]
@@ -254,33 +344,19 @@ class Workers(Process):
                 "index": epoch,
                 "ux": u_hx[k],
                 "uy": u_hy[k],
-                "uz": -0.3 if self.flightStatus[k] == status.Broken else 0
+                "uz": -0.3 if self.flightStatus[k] == Status.Broken.value else 0
             })
 
     # 状态转移
     def updateStatus(self):
-        for index in range(self.n):
-            # 计算无人机开始飞行的时间节点
-            startEpoch = (index % self.n) * interval / self.dt
-
-            # 获取当前实时位置
-            Px, Py = self.positions[index]
-
-            # 无人机由静止开始覆盖任务
-            if self.flightStatus[index] == Status.Stay and self.epoch >= startEpoch:
-                self.flightStatus[index] = Status.Back
-            # 无人机由覆盖开始返回
-            elif self.flightStatus[index] == Status.Cover and Px > positionEnd:
-                self.flightStatus[index] = Status.Back
-            # 已返回覆盖区域
-            elif self.flightStatus[index] == Status.Back and Px >= positionStart and Px <= positionEnd and Py < 2.0 and Py > -2.0:
-                self.flightStatus[index] = Status.Cover
-            elif self.flightStatus[index] == Status.Cover and self.epoch > self.epochNum/2 and index in brokenIndex:
-                self.flightStatus[index] = Status.Broken
-
+        self.flightStatus = statusTransition(
+            self.flightStatus, self.positions[:, 0], self.positions[:, 1],
+            self.epoch, self.epochNum, self.startEpoch, self.broken)
 
     def run(self):
-        print("start calculating!")
+        self.verbose and print("start calculating!")
+        if self.shared:
+            self.__mapShared()
         try:
             # 对每个批次无人机单独进行运算
             while self.epoch < self.epochNum-1:
@@ -295,4 +371,9 @@ class Workers(Process):
 
                 self.epoch += 1
         except Exception as e:
-            print(traceback.print_exc()) # debug exception
\ No newline at end of file
+            self.failed = True
+            print(traceback.print_exc()) # debug exception
+
+        # 通知共享内存的读取方仿真结束
+        if self.shared and self.res is not None:
+            self.res.put(None)
\ No newline at end of file
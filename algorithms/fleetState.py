@@ -0,0 +1,69 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 无人机群状态，位置、朝向和批次按行保存在连续数组中，Id到行号的映射只建立一次
+import numpy as np
+
+# 虚拟位置，即以当前线速度和角速度转圈的圆心，保留两位小数，FleetState和Vor共用
+# 用内置round按十进制取舍，np.round先乘100再取整，在恰好为5的位上可能与之不同
+def toVirtual(positions, poses, lineSpeed, angularSpeed):
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    poses = np.asarray(poses, dtype=float).reshape(-1)
+    radius = lineSpeed / angularSpeed
+    virtual = np.stack([
+        positions[:, 0] - radius * np.sin(poses),
+        positions[:, 1] + radius * np.cos(poses)
+    ], axis=1)
+    return np.array([[round(x, 2), round(y, 2)] for x, y in virtual.tolist()], dtype=float).reshape(-1, 2)
+
+class FleetState:
+    # allCrazyFlies为crazyfiles.yaml中的列表，每项包含Id、Position，可选Pose和Batch
+    def __init__(self, allCrazyFlies):
+        self.IdList = [cf['Id'] for cf in allCrazyFlies]
+        self.rows = {Id: row for row, Id in enumerate(self.IdList)}
+        self.positions = np.array([cf['Position'][0:2] for cf in allCrazyFlies], dtype=float).reshape(-1, 2)
+        self.poses = np.array([cf.get('Pose', 0.0) for cf in allCrazyFlies], dtype=float)
+        self.batches = np.array([cf.get('Batch', 1) for cf in allCrazyFlies], dtype=int)
+
+    def __len__(self):
+        return len(self.IdList)
+
+    # 单架无人机的行号
+    def row(self, Id):
+        return self.rows[Id]
+
+    # 多架无人机的行号
+    def rowsOf(self, Ids):
+        return np.array([self.rows[Id] for Id in Ids], dtype=int)
+
+    # 更新单架无人机的位置和朝向
+    def update(self, Id, position, pose):
+        row = self.rows[Id]
+        self.positions[row] = position[0:2]
+        self.poses[row] = pose
+
+    # 复制一份，位置可替换为新的数组
+    def copy(self, positions=None):
+        fleet = FleetState.__new__(FleetState)
+        fleet.IdList = self.IdList
+        fleet.rows = self.rows
+        fleet.positions = np.array(self.positions if positions is None else positions, dtype=float)
+        fleet.poses = self.poses.copy()
+        fleet.batches = self.batches
+        return fleet
+
+    # 所有无人机的虚拟位置，即以当前线速度和角速度转圈的圆心，保留两位小数
+    def virtualPositions(self, lineSpeed, angularSpeed):
+        return toVirtual(self.positions, self.poses, lineSpeed, angularSpeed)
+
+    # 虚拟位置组成的无人机群
+    def virtual(self, lineSpeed, angularSpeed):
+        return self.copy(self.virtualPositions(lineSpeed, angularSpeed))
+
+    # 转换回列表形式，用于保存或兼容旧接口
+    def toList(self):
+        return [{
+            'Id': Id,
+            'Pose': float(self.poses[row]),
+            'Batch': int(self.batches[row]),
+            'Position': self.positions[row].tolist()
+        } for row, Id in enumerate(self.IdList)]
@@ -0,0 +1,50 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 对比逐架求解和联合求解的耗时，使用crazyfiles.yaml中的12架无人机
+import sys
+import os
+import copy
+import time
+import yaml
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.cassingle_coverage.borderdVoronoi import Vor
+from algorithms.cassingle_coverage.cassingle import Cassingle
+from devTools.benchCodegen import task, numIterations, xRange, yRange, box, lineSpeed, angularSpeed, T, N, volume
+
+def run(parallelization):
+    with open(os.path.join(parentUrl, "crazyfiles.yaml"), "r") as f:
+        allCrazyFlies = copy.deepcopy(yaml.load(f, Loader=yaml.FullLoader)['files'])
+
+    vor = Vor(box, lineSpeed, angularSpeed)
+    cassingle = Cassingle(lineSpeed, angularSpeed, T, N, xRange, yRange, volume,
+        method="objective", parallelization=parallelization or "serial")
+
+    epochTime = []
+    for counter in range(numIterations + 1):
+        tasks = task(vor, allCrazyFlies)
+        start = time.time()
+        if parallelization is None:
+            outPuts = [cassingle.update(*args) for args in tasks]
+        else:
+            outPuts = cassingle.update_all(*[list(item) for item in zip(*tasks)])
+        # 第一轮包含构建求解器的时间，不计入
+        if counter > 0:
+            epochTime.append(time.time() - start)
+
+        for args, outPut in zip(tasks, outPuts):
+            cf = [item for item in allCrazyFlies if item['Id'] == args[-1]][0]
+            cf['Position'] = outPut[-1][0:2]
+            cf['Pose'] = round(outPut[-1][-1], 2)
+
+    return np.mean(epochTime)
+
+if __name__ == "__main__":
+    for name, parallelization in [("N small solves", None), ("one solve, serial", "serial"),
+        ("one solve, openmp", "openmp"), ("one solve, thread", "thread")]:
+        print("{}: {}s per epoch".format(name, round(run(parallelization), 4)))
@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 对比MX解释执行和编译后的求解器耗时，使用crazyfiles.yaml中的12架无人机
+import sys
+import os
+import copy
+import time
+import tempfile
+import yaml
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.cassingle_coverage.borderdVoronoi import Vor
+from algorithms.cassingle_coverage.cassingle import Cassingle
+
+# 与online_casadi_pose.py保持一致的实验参数
+numIterations = 5
+xRange = 3.0
+yRange = 2.0
+box = np.array([-xRange, xRange, -yRange, yRange])
+lineSpeed = 0.1
+angularSpeed = 0.2
+T = 5.0
+N = 10
+volume = 0.05
+
+def run(codegen, codegenDir):
+    with open(os.path.join(parentUrl, "crazyfiles.yaml"), "r") as f:
+        allCrazyFlies = copy.deepcopy(yaml.load(f, Loader=yaml.FullLoader)['files'])
+
+    vor = Vor(box, lineSpeed, angularSpeed)
+    cassingle = Cassingle(lineSpeed, angularSpeed, T, N, xRange, yRange, volume,
+        method="objective", codegen=codegen, codegenDir=codegenDir)
+
+    # 首次构建和求解的耗时，包括代码生成和编译
+    start = time.time()
+    cassingle.update(*task(vor, allCrazyFlies)[0])
+    setupTime = time.time() - start
+
+    solveTime = []
+    for counter in range(numIterations):
+        for args in task(vor, allCrazyFlies):
+            outPut = cassingle.update(*args)
+            solveTime.append(cassingle.solveStats[args[-1]]['time'])
+            cf = [item for item in allCrazyFlies if item['Id'] == args[-1]][0]
+            cf['Position'] = outPut[-1][0:2]
+            cf['Pose'] = round(outPut[-1][-1], 2)
+
+    return setupTime, np.mean(solveTime), np.sum(solveTime)
+
+# 每架无人机的求解参数
+def task(vor, allCrazyFlies):
+    vorResult = vor.updateVor(allCrazyFlies)
+    virtualResult = vor.virtualVor(allCrazyFlies)
+    tasks = []
+    for flie in vorResult:
+        cf = [item for item in allCrazyFlies if item['Id'] == flie['Id']][0]
+        virtualFlie = [item for item in virtualResult if item['Id'] == flie['Id']][0]
+        tasks.append((flie['vertices'], flie['centroid'], virtualFlie['vertices'],
+            cf['Position'], cf['Pose'], flie['Id']))
+    return tasks
+
+if __name__ == "__main__":
+    # 使用空的缓存目录，第二次编译运行直接加载第一次生成的动态库
+    codegenDir = tempfile.mkdtemp()
+    for name, codegen in [("MX", False), ("compiled", True), ("compiled (cached)", True)]:
+        setupTime, meanTime, totalTime = run(codegen, codegenDir)
+        print("{}: setup {}s, mean solve {}s, total solve {}s".format(
+            name, round(setupTime, 3), round(meanTime, 4), round(totalTime, 3)))
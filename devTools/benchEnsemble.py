@@ -0,0 +1,47 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 多组无人机群同时仿真的吞吐量，单位为每秒计算的无人机步数，并与逐组运行Workers对比
+import sys
+import os
+import yaml
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.connect_coverage.worker import Workers
+from algorithms.connect_coverage.ensemble import Ensemble
+
+dt = 0.1
+ensembleSizes = [1, 4, 16, 64, 256]
+jitter = 0.05 # 初始位置的随机扰动
+brokenRate = 0.2 # 每架无人机损坏的概率
+
+if __name__ == "__main__":
+    with open(os.path.join(parentUrl, "crazyfiles.yaml"), "r") as f:
+        allCrazyFlies = yaml.load(f, Loader=yaml.FullLoader)['files']
+    positions = np.array([cf['Position'] for cf in allCrazyFlies], dtype=float)
+    n = len(positions)
+
+    # 单组与Workers的结果对比
+    process = Workers('bench', None, allCrazyFlies, dt, verbose=False)
+    process.run()
+    single = Ensemble(positions[np.newaxis], dt)
+    single.run()
+    print("max position difference against Workers: {}".format(max(
+        np.abs(single.Px_h[0] - process.Px_h).max(),
+        np.abs(single.Py_h[0] - process.Py_h).max()
+    )))
+
+    rng = np.random.default_rng(0)
+    for E in ensembleSizes:
+        ensemble = Ensemble(
+            positions + rng.normal(0, jitter, (E, n, 2)),
+            dt,
+            rng.random((E, n)) < brokenRate,
+            record=False
+        )
+        rate = ensemble.run()
+        print("{} swarms: {} agent-steps/s, {}s".format(E, int(rate), round(ensemble.consume, 3)))
@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 对比稠密eigh和热启动LOBPCG求Fiedler值的耗时，无人机每个时刻随机移动一小段，LOBPCG从上一时刻的Fiedler向量开始
+import sys
+import os
+import time
+import warnings
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.connect_coverage.func import Func
+from algorithms.connect_coverage.fiedler import Fiedler
+
+fleetSizes = [12, 25, 50, 100, 200, 300, 400, 600, 800, 1000, 1200, 1600]
+epochNum = 20
+step = 0.05
+
+# 只统计求特征值的时间，两种方法使用相同的移动序列
+def measure(fiedler, func, positions):
+    np.random.seed(0)
+    values = []
+    consume = 0
+    for epoch in range(epochNum):
+        positions = positions + np.random.uniform(-step, step, positions.shape)
+        L, A, d = func.L_Mat(positions)
+        start = time.time()
+        value, vector = fiedler.update(L)
+        consume += time.time() - start
+        values.append(value)
+    return np.array(values), consume / epochNum
+
+if __name__ == "__main__":
+    # LOBPCG达到maxiter时给出警告并返回当前结果，结果误差在输出中体现
+    warnings.simplefilter("ignore", UserWarning)
+    crossover = None
+    for n in fleetSizes:
+        # 场地随无人机数目放大，保持平均邻居数目不变
+        side = np.sqrt(n)
+        np.random.seed(n)
+        positions = np.random.uniform(0, side, (n, 2))
+        func = Func(0, side, 0, np.pi, 2.0, 0.2, 5/180*np.pi, 0.1, 0.1, sparse=True)
+        denseValues, denseTime = measure(Fiedler(threshold=np.inf), func, positions)
+        sparseValues, sparseTime = measure(Fiedler(threshold=0), func, positions)
+        # 交叉点为此后所有规模下LOBPCG都更快的最小规模
+        if sparseTime >= denseTime:
+            crossover = None
+        elif crossover is None:
+            crossover = n
+        print("{} agents: dense eigh {}ms, warm LOBPCG {}ms, max lambda_2 difference {}".format(
+            n, round(denseTime * 1000, 3), round(sparseTime * 1000, 3),
+            np.format_float_scientific(np.abs(denseValues - sparseValues).max(), 1)))
+    print("warm LOBPCG is faster from {} agents".format(crossover))
@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 对比单步打靶和多步打靶(ipopt、fatrop)在不同时域长度下的求解耗时，每步时长不变，N越大规划的时域越长
+import sys
+import os
+import copy
+import time
+import yaml
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.cassingle_coverage.borderdVoronoi import Vor
+from algorithms.cassingle_coverage.cassingle import Cassingle
+from devTools.benchCodegen import task, xRange, yRange, box, lineSpeed, angularSpeed, T, N, volume
+
+horizons = [10, 20, 40, 80]
+stepTime = T / N # 每步时长与online_casadi_pose.py相同
+droneNum = 4 # 每种设置求解的无人机数目，单步打靶在N较大时很慢
+
+def run(horizon, shooting, solverName):
+    with open(os.path.join(parentUrl, "crazyfiles.yaml"), "r") as f:
+        allCrazyFlies = copy.deepcopy(yaml.load(f, Loader=yaml.FullLoader)['files'])
+
+    vor = Vor(box, lineSpeed, angularSpeed)
+    cassingle = Cassingle(lineSpeed, angularSpeed, stepTime * horizon, horizon, xRange, yRange, volume,
+        method="objective", shooting=shooting, solverName=solverName)
+    tasks = task(vor, allCrazyFlies)[:droneNum]
+
+    # 首次求解包含构建求解器的时间
+    start = time.time()
+    cassingle.update(*tasks[0])
+    setupTime = time.time() - start
+
+    solveTime = []
+    iterations = []
+    tracks = []
+    for args in tasks:
+        outPut = cassingle.update(*args)
+        solveTime.append(cassingle.solveStats[args[-1]]['time'])
+        iterations.append(cassingle.solveStats[args[-1]]['iter'])
+        tracks.append(np.array(outPut)[:, 0:2])
+
+    return setupTime, np.mean(solveTime), np.mean(iterations), tracks
+
+if __name__ == "__main__":
+    for horizon in horizons:
+        reference = None
+        for name, shooting, solverName in [("single shooting, ipopt", "single", "ipopt"),
+            ("multiple shooting, ipopt", "multiple", "ipopt"), ("multiple shooting, fatrop", "multiple", "fatrop")]:
+            setupTime, meanTime, meanIter, track = run(horizon, shooting, solverName)
+            # 与单步打靶的轨迹差异，两种离散方式是同一个问题，时域较长时可能收敛到不同的局部最优
+            if reference is None:
+                reference = track
+            difference = max([np.abs(a - b).max() for a, b in zip(reference, track)])
+            print("N={}, {}: setup {}s, mean solve {}s, {} iterations, max track difference {}".format(
+                horizon, name, round(setupTime, 3), round(meanTime, 4), round(meanIter, 1), difference))
@@ -0,0 +1,55 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 对比每轮下发任务的序列化字节数和耗时，使用crazyfiles.yaml中的12架无人机
+import sys
+import os
+import time
+import pickle
+import yaml
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.cassingle_coverage.borderdVoronoi import Vor
+from algorithms.cassingle_coverage.cassingle import Cassingle
+from algorithms.cassingle_coverage.solverPool import packTask
+from devTools.benchCodegen import xRange, yRange, box, lineSpeed, angularSpeed, T, N, volume
+
+repeat = 100
+
+# 序列化一轮全部任务，返回总字节数和平均耗时
+def measure(tasks):
+    start = time.time()
+    for counter in range(repeat):
+        size = sum([len(pickle.dumps(item, pickle.HIGHEST_PROTOCOL)) for item in tasks])
+    return size, (time.time() - start) / repeat
+
+if __name__ == "__main__":
+    with open(os.path.join(parentUrl, "crazyfiles.yaml"), "r") as f:
+        allCrazyFlies = yaml.load(f, Loader=yaml.FullLoader)['files']
+
+    vor = Vor(box, lineSpeed, angularSpeed)
+    cassingle = Cassingle(lineSpeed, angularSpeed, T, N, xRange, yRange, volume, method="objective")
+    vorResult = vor.updateVor(allCrazyFlies)
+    virtualResult = vor.virtualVor(allCrazyFlies)
+
+    formats = {
+        # 每个任务携带求解实例、全部维诺划分和无人机列表
+        "full": [(flie, virtualResult, cassingle, allCrazyFlies) for flie in vorResult],
+        # 求解实例常驻进程
+        "resident": [(flie, virtualResult, allCrazyFlies, None) for flie in vorResult],
+        # 只携带对应无人机的数据
+        "compact": []
+    }
+    for flie in vorResult:
+        cf = [item for item in allCrazyFlies if item['Id'] == flie['Id']][0]
+        virtualFlie = [virtual for virtual in virtualResult if virtual['Id'] == flie['Id']][0]
+        formats["compact"].append(packTask(flie['Id'], flie['vertices'], virtualFlie['vertices'],
+            flie['centroid'], cf['Position'], cf['Pose']))
+
+    for name, tasks in formats.items():
+        size, cost = measure(tasks)
+        print("{}: {} bytes per epoch, {}ms to serialize".format(name, size, round(cost * 1000, 3)))
@@ -0,0 +1,40 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 对比镜像法和直接裁剪法的维诺划分耗时，随机生成不同规模的无人机位置
+import sys
+import os
+import time
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.cassingle_coverage.borderdVoronoi import Vor
+
+xRange = 3.0
+yRange = 2.0
+box = np.array([-xRange, xRange, -yRange, yRange])
+fleetSizes = [12, 25, 50, 100, 200, 400, 800, 1600, 3200]
+repeat = 10
+
+def measure(vor, allCrazyFlies):
+    start = time.time()
+    for counter in range(repeat):
+        vor.updateVor(allCrazyFlies)
+    return (time.time() - start) / repeat
+
+if __name__ == "__main__":
+    mirror = Vor(box, 0.1, 0.2, method="mirror")
+    clip = Vor(box, 0.1, 0.2, method="clip")
+    crossover = None
+    for n in fleetSizes:
+        positions = np.random.uniform([-xRange, -yRange], [xRange, yRange], (n, 2))
+        allCrazyFlies = [{'Id': index, 'Position': positions[index].tolist(), 'Pose': 0.0} for index in range(n)]
+        mirrorTime = measure(mirror, allCrazyFlies)
+        clipTime = measure(clip, allCrazyFlies)
+        if crossover is None and clipTime < mirrorTime:
+            crossover = n
+        print("{} drones: mirror {}ms, clip {}ms".format(n, round(mirrorTime * 1000, 3), round(clipTime * 1000, 3)))
+    print("clip is faster from {} drones".format(crossover))
@@ -0,0 +1,140 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 对比连通保持控制律和覆盖控制律的向量化实现与逐个智能体循环的原实现的耗时，
+# 结果一致性由tests/test_connect_func.py检查，原实现也供其使用
+import sys
+import os
+import time
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.connect_coverage.func import Func
+
+angleStart, angleEnd = np.pi*165/180, np.pi*195/180
+fleetSizes = [12, 50, 200, 800]
+repeat = 20
+
+# 原实现，逐个智能体累加邻居的梯度
+def loopConPre(func, features, featureVec, positions, distMatrix, A):
+    n = positions.shape[0]
+    value = -(func.radius**2/np.log(func.delta))/2
+    uc = np.zeros((n, 2))
+    for i in range(n):
+        if features[i] <= func.epsilon:
+            a1 = -50000
+        else:
+            a1 = -10/(np.sinh(features[i] - func.epsilon) ** 2)
+
+        a2x, a2y = 0, 0
+        connectedIndex = np.where(distMatrix[i, :] <= func.radius)[0]
+        connectedIndex = np.delete(connectedIndex, connectedIndex == i)
+
+        for agent in connectedIndex:
+            a2x += (-(A[i, agent])/value)*(positions[i, 0] - positions[agent, 0])*((featureVec[i]-featureVec[agent])**2)
+            a2y += (-(A[i, agent])/value)*(positions[i, 1] - positions[agent, 1])*((featureVec[i]-featureVec[agent])**2)
+
+        uc[i, :] = np.array([-a1*a2x, -a1*a2y])
+    return uc
+
+# 原实现，逐个智能体排序邻居朝向角并查找自身位置
+def loopCcangle(func, agentPos, angles, ueHisY, agentAngles):
+    # 智能体数目
+    n = agentPos.shape[0]
+    ue = np.zeros(n)
+    bestAngle = np.zeros(n)
+
+    # 限制智能体角度范围
+    lessIndex = angles < func.angleStart
+    largerIndex = angles > func.angleEnd
+    bestAngle[lessIndex] = func.angleStart + func.cov / 2
+    bestAngle[largerIndex] = func.angleEnd - func.cov / 2
+
+    # 得到距离矩阵
+    distMatrix = squareform(pdist(agentPos, 'euclidean'))
+
+    # 未赋值，说明智能体角度在限制范围内
+    for index, value in enumerate(bestAngle):
+        if value == 0:
+            # 获取邻居距离
+            distConnected = distMatrix[index, :]
+            connectedIndex = np.where(distConnected <= func.radius)[0]
+            # 取出邻居朝向角
+            angleList = [func.angleStart, func.angleEnd] + angles[connectedIndex].tolist()
+            angleList = np.array(sorted(angleList))
+
+            indexPos = np.where(angleList == angles[index])[0][0]
+            bestAngle[index] = (angleList[indexPos - 1] + angleList[indexPos + 1]) / 2
+    # 影响程度受距离的影响，距离雷达越近，通常的影响越小
+    beta = 0.1
+    gamma = 0.01
+    gradient = (gamma - beta) / (func.positionEnd - func.positionStart)
+    intercept = beta - func.positionStart * gradient
+
+    alpha = gradient * agentPos[:, 0] + intercept
+    sameTrendIndex = ueHisY * (angles - bestAngle) >= 0
+
+    ue[sameTrendIndex] = ueHisY[sameTrendIndex] + alpha[sameTrendIndex] * (angles[sameTrendIndex] - bestAngle[sameTrendIndex])
+    # 相反运动趋势
+    ue[~sameTrendIndex] = -ueHisY[~sameTrendIndex] + alpha[~sameTrendIndex] * (angles[~sameTrendIndex] - bestAngle[~sameTrendIndex])
+    temp = np.abs(ue)
+    # 取最小值
+    temp[temp > func.vMax] = func.vMax
+    ue = np.sign(ue) * temp
+
+    # 保证无人机相邻时刻转角的幅度在pi/12之内
+    angleChangeIndex = np.abs(np.arctan(ue/func.vMax) - agentAngles) > np.pi / 30
+    # 符合条件
+    newAngle = agentAngles[angleChangeIndex] + np.sign(angles[angleChangeIndex] - bestAngle[angleChangeIndex]) * np.pi / 30
+    ue[angleChangeIndex] = func.vMax * np.tan(newAngle)
+
+    # 保证无人机速度范围在-pi/3 ~ pi/3
+    lessIndex = np.arctan(ue / func.vMax) < -np.pi / 3
+    largerIndex = np.arctan(ue / func.vMax) > np.pi / 3
+
+    ue[lessIndex] = func.vMax * np.tan(-np.pi / 3)
+    ue[largerIndex] = func.vMax * np.tan(np.pi / 3)
+    return ue
+
+def randomFleet(n):
+    positions = np.random.uniform([-2.5, -3.0], [3.0, 3.0], (n, 2))
+    angles = np.random.uniform(angleStart - 0.1, angleEnd + 0.1, n)
+    # 构造相同朝向角和恰好位于限定角度上的情况
+    angles[1] = angles[0]
+    angles[2] = angleStart
+    angles[3] = angleEnd
+    return positions, angles
+
+def measure(function, *args):
+    start = time.time()
+    for counter in range(repeat):
+        result = function(*args)
+    return result, (time.time() - start) / repeat
+
+if __name__ == "__main__":
+    np.random.seed(0)
+    for n in fleetSizes:
+        for radius in [1.0, 10.0]:
+            func = Func(-2.5, 3.0, angleStart, angleEnd, radius, 0.2, 5/180*np.pi, 0.1, 0.1)
+            sparseFunc = Func(-2.5, 3.0, angleStart, angleEnd, radius, 0.2, 5/180*np.pi, 0.1, 0.1, sparse=True)
+            positions, angles = randomFleet(n)
+            L, A, d = func.L_Mat(positions)
+            sparseL, sparseA, sparseD = sparseFunc.L_Mat(positions)
+            featureVec = np.random.randn(n)
+            for value in [0.05, 0.5]:
+                features = np.ones(n) * value
+                expect, conLoopTime = measure(loopConPre, func, features, featureVec, positions, d, A)
+                result, conDenseTime = measure(func.con_pre, features, featureVec, positions, d, A)
+                sparseResult, conSparseTime = measure(sparseFunc.con_pre, features, featureVec, positions, sparseD, sparseA)
+            ueHisY = np.random.uniform(-0.2, 0.2, n)
+            agentAngles = np.random.uniform(-0.5, 0.5, n)
+            expect, angleLoopTime = measure(loopCcangle, func, positions, angles, ueHisY, agentAngles)
+            result, angleDenseTime = measure(func.ccangle, positions, angles, ueHisY, agentAngles)
+            sparseResult, angleSparseTime = measure(sparseFunc.ccangle, positions, angles, ueHisY, agentAngles)
+            print("{} drones, radius {}: con_pre loop {}ms, dense {}ms, sparse {}ms; ccangle loop {}ms, dense {}ms, sparse {}ms".format(
+                n, radius, round(conLoopTime * 1000, 3), round(conDenseTime * 1000, 3), round(conSparseTime * 1000, 3),
+                round(angleLoopTime * 1000, 3), round(angleDenseTime * 1000, 3), round(angleSparseTime * 1000, 3)))
@@ -5,9 +5,11 @@ import os
 import yaml
 import numpy as np
 import time
-from multiprocessing import Process, Queue
+import multiprocessing
+import threading
 import argparse
 import pickle
+from concurrent.futures import wait, FIRST_COMPLETED
 
 # if python3
 time.clock = time.time
@@ -22,6 +24,13 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--local", help="Run using local simulation.", action="store_true")
 parser.add_argument("--record", help="save the waypoints.", action="store_true")
 parser.add_argument("--load", help="load waypoints from record.", action="store_true")
+parser.add_argument("--codegen", help="compile the solver to native code.", action="store_true")
+parser.add_argument("--batch", help="solve all drones in one problem.", action="store_true")
+parser.add_argument("--multiple", help="use the multiple-shooting formulation.", action="store_true")
+parser.add_argument("--fatrop", help="solve the multiple-shooting problem with fatrop.", action="store_true")
+parser.add_argument("--deadline", help="plan every epoch within T/N, late or failed solves use a fallback plan.", action="store_true")
+parser.add_argument("--pipeline", help="plan the next epoch while the current one is flown.", action="store_true")
+parser.add_argument("--async", dest="asynchronous", help="replan every drone as soon as its Voronoi neighbors are ready, without a global barrier per epoch.", action="store_true")
 args = parser.parse_args()
 
 if not args.local:
@@ -33,12 +42,17 @@ if not args.local:
 from algorithms.cassingle_coverage.borderdVoronoi import Vor
 from algorithms.cassingle_coverage.cassingle import Cassingle
 from algorithms.cassingle_coverage.graphController import Graph
+from algorithms.cassingle_coverage.solverPool import SolverPool, packTask, unpackTask
+from algorithms.cassingle_coverage.ringBuffer import RingBuffer
+from algorithms.fleetState import FleetState
 
 # 读取无人机位置配置
 # with open("online_simulation/crazyfiles.yaml", "r") as f:
 with open("crazyfiles.yaml", "r") as f:
     data = yaml.load(f, Loader=yaml.FullLoader)
 allCrazyFlies = data['files']
+# 位置和朝向按行保存，Id到行号的映射只建立一次
+fleet = FleetState(allCrazyFlies)
 
 # 实验参数
 STOP = False
@@ -48,72 +62,88 @@ yRange = 2.0
 box = np.array([-xRange, xRange, -yRange, yRange])  # 场地范围
 lineSpeed = 0.1
 angularSpeed = 0.2
-draw =  True# 是否画图
+pipeline = args.pipeline and not args.local and not args.load # --pipeline边规划边飞行，本地模拟或读取路径时不需要
+draw = not pipeline # 是否画图，流水线模式在子线程中规划，不画图
 T = 5.0
 N = 10
 allcfsTime = T/N
 volume = 0.05
 Z = .0 # 高度
-processNum = len(allCrazyFlies) # 进程数，默认和无人机个数相同
-calculTimeOut = 30 # 每轮运算超时设定
-
-class workers(Process):
-    def __init__(self, q, name, res):
-        Process.__init__(self)
-        self.q = q
-        self.res = res
-        self.name = name
-
-    def run(self):
-        print(self.name+" started!")
-        while True:
-            if not self.q.empty():
-                try:
-                    flie, virtualResult, cassingle, allCrazyFlies = self.q.get(False)
-                    self.res.put(vorProcess(flie, virtualResult, cassingle, allCrazyFlies))
-                except Exception as e:
-                    pass
-
-def multiProcess(taskPool, resultStorage):
-    # 进程名称
-    casadiLists = ["Process"+str(i) for i in range(1, 1+processNum)]
-    # 储存列表
-    processList = []
-
-    for processName in casadiLists:
-        # 创建新进程，传递输入和输出列表
-        process = workers(taskPool, processName, resultStorage)
-        # 将进程设置为守护进程，当主程序结束时，守护进程会被强行终止
-        process.daemon = True
-        process.start()
-        processList.append(process)
-
-    return processList
-
-def vorProcess(flie, virtualResult, cassingle, allCrazyFlies):
-    waypoints = []
-    # 找出对应Id储存在allcrazyfiles中的索引
-    [matchIndex] =  [index for (index, item) in enumerate(allCrazyFlies) if item['Id'] == flie['Id']]
+processNum = multiprocessing.cpu_count() # 进程数，默认和CPU核数相同
+pipelineDepth = 2 # 流水线模式下规划最多领先飞行的轮数
+asynchronous = args.asynchronous and not args.batch # --async逐架异步规划，联合求解时不适用
+calculTimeOut = 30 # 每轮规划的超时设定，超时的无人机使用后备轨迹
+epochBudget = T # --deadline时每轮规划的时间预算，每轮飞完整个时域的N步，用时T，规划须在飞完前一轮之前完成
+fallbackReserve = 0.2 * epochBudget # --deadline时每轮最后留给结果收发、更新位置和画图的时间
+# --deadline时每次求解的时间上限，逐架求解时按每个进程轮流处理的任务数均分
+solveRounds = 1 if args.batch else -(-len(fleet) // processNum)
+solveBudget = (epochBudget - fallbackReserve) / solveRounds if args.deadline else None
+
+# 生成本轮的求解任务，每个任务只携带对应无人机的数据
+def makeTasks(vorResult, virtualResult, fleet):
+    tasks = []
+    virtualById = {virtual['Id']: virtual for virtual in virtualResult}
+    for flie in vorResult:
+        row = fleet.row(flie['Id'])
+        # 虚拟位置在场地外时没有虚拟维诺单元，目标函数改用真实位置的维诺单元
+        virtualFlie = virtualById.get(flie['Id'], flie)
+        tasks.append(packTask(
+            flie['Id'],
+            flie['vertices'],
+            virtualFlie['vertices'],
+            flie['centroid'],
+            fleet.positions[row],
+            fleet.poses[row]
+        ))
+    return tasks
 
-    # 找到对应Id的虚拟维诺划分
-    virtualFlie = [virtual for virtual in virtualResult if virtual['Id'] == flie['Id']][0]
+def vorProcess(cassingle, message):
+    Id, vertices, virtualVertices, centroid, position, pose = unpackTask(message)
 
     # casadi运算下一步位置
-    outPut = cassingle.update(
-        flie['vertices'],
-        flie['centroid'],
-        virtualFlie['vertices'],
-        allCrazyFlies[matchIndex]['Position'],
-        allCrazyFlies[matchIndex]['Pose']
+    outPut = cassingle.update(vertices, centroid, virtualVertices, position, pose, Id)
+
+    return packResult(Id, outPut, cassingle)
+
+# 求解任务没有按时返回，在主进程中直接使用后备轨迹
+def lateProcess(cassingle, message):
+    Id, vertices, virtualVertices, centroid, position, pose = unpackTask(message)
+
+    outPut = cassingle.fallback(vertices, centroid, virtualVertices, position, pose, Id)
+
+    info = packResult(Id, outPut, cassingle)
+    info['stats']['late'] = True
+    return info
+
+# 所有无人机在主进程中联合求解，不经过任务队列
+def batchProcess(vorResult, virtualResult, cassingle, fleet):
+    rows = fleet.rowsOf([flie['Id'] for flie in vorResult])
+    virtualById = {virtual['Id']: virtual for virtual in virtualResult}
+    # 没有虚拟维诺单元的无人机使用真实位置的维诺单元，与makeTasks相同
+    virtualFlies = [virtualById.get(flie['Id'], flie) for flie in vorResult]
+
+    outPuts = cassingle.update_all(
+        [flie['vertices'] for flie in vorResult],
+        [flie['centroid'] for flie in vorResult],
+        [virtualFlie['vertices'] for virtualFlie in virtualFlies],
+        fleet.positions[rows].tolist(),
+        fleet.poses[rows].tolist(),
+        [flie['Id'] for flie in vorResult]
     )
 
+    return [packResult(flie['Id'], outPut, cassingle) for flie, outPut in zip(vorResult, outPuts)]
+
+# 整理单架无人机的求解结果
+def packResult(Id, outPut, cassingle):
+    waypoints = []
+
     # 待更新的位置信息
     newPosition = [pos for pos in outPut[-1][0:2]]
     newPose = round(outPut[-1][-1], 2)
 
     for timeIndex, item in enumerate(outPut):
         waypoints.append({
-            'Id': allCrazyFlies[matchIndex]['Id'],
+            'Id': Id,
             'Px': item[0],
             'Py': item[1],
             'theta': item[2],
@@ -122,33 +152,44 @@ def vorProcess(flie, virtualResult, cassingle, allCrazyFlies):
 
     info = {
         "track": np.array(outPut),
-        "Id": allCrazyFlies[matchIndex]['Id'],
+        "Id": Id,
         "newPosition": newPosition,
         "newPose": newPose,
-        "waypoints": waypoints
+        "waypoints": waypoints,
+        "stats": dict(cassingle.solveStats[Id])
     }
 
     return info
 
-# 通过casadi计算得到结果
-def getWaypoint():
+# 按命令行参数创建求解实例
+def newCassingle():
+    # fatrop只能求解多步打靶的逐架问题，联合求解时仍使用ipopt
+    return Cassingle(lineSpeed, angularSpeed, T, N, xRange, yRange, volume, method="objective", codegen=args.codegen,
+        shooting="multiple" if args.multiple or args.fatrop else "single", solverName="fatrop" if args.fatrop else "ipopt",
+        maxWallTime=solveBudget)
+
+# 通过casadi计算得到结果，handoff不为None时每轮规划完成后连同完成时刻交给飞控，缓冲区满时等待
+def getWaypoint(handoff=None):
     # 时间统计
     start = time.clock()
 
     vor = Vor(box, lineSpeed, angularSpeed)
-
-    cassingle = Cassingle(lineSpeed, angularSpeed, T, N, xRange, yRange, volume, method="objective")
+    cassingle = newCassingle()
 
     if draw:
-        graph = Graph([str(cf['Id']) for cf in allCrazyFlies], xRange, yRange)
+        graph = Graph([str(Id) for Id in fleet.IdList], xRange, yRange)
 
     allWaypoints = []
 
-    taskPool = Queue() # 根据参数创建队列
-
-    resultStorage = Queue() # 储存进程运算结果的队列
+    # 联合求解在主进程中进行，不需要子进程
+    if not args.batch:
+        solverPool = SolverPool(cassingle, processNum)
 
-    processList = multiProcess(taskPool, resultStorage)
+    # 后备轨迹的使用次数，late为没有按时返回的求解任务；--deadline时规划超时的轮数
+    fallbacks = {}
+    deadlineMisses = 0
+    # --deadline时每轮的截止时刻在固定的时间网格上，前一轮提前完成时后一轮有更多余量
+    epochDeadline = time.time()
 
     print("start calculating!")
 
@@ -159,43 +200,62 @@ def getWaypoint():
         ))
 
         # 更新维诺划分，下面过程中需要真实的和虚拟的位置
-        vorResult = vor.updateVor(allCrazyFlies)
-        virtualResult = vor.virtualVor(allCrazyFlies)
-
-        # 将任务发布到队列中，等待守护进程进行处理
-        for flie in vorResult:
-            taskPool.put((flie, virtualResult, cassingle, allCrazyFlies))
-
-        calculTime = time.clock()
-
-        # 等待所有的任务执行完毕
-        while True:
-            # 超时，程序退出
-            if time.clock() - calculTime > calculTimeOut:
-                print("flies out of range, program exit!")
-                sys.exit(0)
-
-            if resultStorage.qsize() == len(allCrazyFlies):
-                break
+        vorResult = vor.updateVor(fleet)
+        virtualResult = vor.virtualVor(fleet)
+
+        if args.deadline:
+            epochDeadline += epochBudget
+        else:
+            epochDeadline = time.time() + calculTimeOut
+
+        results = []
+        if args.batch:
+            results = batchProcess(vorResult, virtualResult, cassingle, fleet)
+        else:
+            # 将任务发布到进程池中，等待到本轮截止时刻，没有按时返回或求解出错的无人机使用后备轨迹
+            tasks = makeTasks(vorResult, virtualResult, fleet)
+            solveDeadline = epochDeadline - fallbackReserve if args.deadline else epochDeadline
+            futures = solverPool.submitAll(vorProcess, [(message,) for message in tasks], solveDeadline)
+            # --deadline时在等待求解的同时于主进程中算好所有无人机的后备轨迹，截止时刻之后不再计算
+            backups = [lateProcess(cassingle, message) if args.deadline else None for message in tasks]
+            results = solverPool.gather(futures, solveDeadline)
+            results = [info if info is not None else backup if backup is not None else lateProcess(cassingle, message)
+                for info, backup, message in zip(results, backups, tasks)]
 
         waypoints = []
+        solveStats = []
 
         # 将进程结果取出绘画出来
-        while not resultStorage.empty():
-            info = resultStorage.get()
-            [matchIndex] =  [index for (index, item) in enumerate(allCrazyFlies) if item['Id'] == info["Id"]]
-            allCrazyFlies[matchIndex]['Position'] = info['newPosition']
-            allCrazyFlies[matchIndex]['Pose'] = info['newPose']
+        for info in results:
+            solveStats.append(info['stats'])
+            fleet.update(info["Id"], info['newPosition'], info['newPose'])
             draw and graph.updateTrack(
                     info['track'],
                     info["Id"]
                 )
             waypoints += info['waypoints']
 
+        # 统计后备轨迹
+        epochFallbacks = {}
+        for item in solveStats:
+            for kind in [item.get('fallback'), 'late' if item.get('late') else None]:
+                if kind is not None:
+                    epochFallbacks[kind] = epochFallbacks.get(kind, 0) + 1
+                    fallbacks[kind] = fallbacks.get(kind, 0) + 1
+
+        # 输出本轮求解统计
+        print("solve iterations: {}, solve time: {}s, fallbacks: {}".format(
+            round(np.mean([item['iter'] for item in solveStats]), 2),
+            round(np.mean([item['time'] for item in solveStats]), 4),
+            epochFallbacks
+        ))
+
         # 根据时间索引进行排序
         waypoints = sorted(waypoints, key = lambda i: i['index'])
 
         allWaypoints.append(waypoints)
+        if handoff is not None:
+            handoff.put((time.time(), waypoints))
 
         # 更新维诺质心
         draw and graph.updateCentroid(
@@ -207,20 +267,267 @@ def getWaypoint():
         draw and graph.updateRidges(virtualResult)
         # draw and graph.updateRidges(vorResult)
 
+        # 本轮(包括后备轨迹和画图)超时，截止时刻从当前时间重新对齐，超出的时间不占用下一轮
+        if args.deadline and time.time() > epochDeadline:
+            deadlineMisses += 1
+            epochDeadline = time.time()
+
     print("consume: {}s to go through casadi".format(time.clock() - start))
+    if args.deadline:
+        print("fallbacks: {}, deadline misses: {}/{}".format(fallbacks, deadlineMisses, numIterations))
+    else:
+        print("fallbacks: {}".format(fallbacks))
+
+    if not args.batch:
+        solverPool.shutdown()
 
     print("all children process closed.")
 
     return allWaypoints
 
+# 异步规划，没有每轮的全局同步，某架无人机求解完成后只重新检查它和等待它的无人机，就绪的立即规划下一轮
+# 无人机规划第e轮时，使用各无人机第e轮的状态划分，尚未完成前面各轮的无人机(落后的无人机)使用其最新状态；
+# 规划前要求相邻无人机(真实和虚拟位置的维诺图)都已完成前面各轮，且落后的无人机在追上之前不可能移动到影响本单元的范围内，
+# 因此得到的维诺单元与同步规划相同，不会重叠；没有维诺单元的无人机等待所有无人机
+# 每次检查只用Vor.localVor重新计算候选无人机的单元，只裁剪附近无人机的中垂线，不重新划分整个场地
+# 所有无人机都完成第e轮规划后按轮输出航点，与getWaypoint相同，handoff用法也相同
+def getWaypointAsync(handoff=None):
+    # 时间统计
+    start = time.clock()
+
+    vor = Vor(box, lineSpeed, angularSpeed)
+    cassingle = newCassingle()
+
+    if draw:
+        graph = Graph([str(Id) for Id in fleet.IdList], xRange, yRange)
+
+    allWaypoints = []
+    solverPool = SolverPool(cassingle, processNum)
+    fallbacks = {}
+
+    # 每架无人机各轮规划完成后的状态，第0行为初始状态
+    cfNum = len(fleet)
+    allRows = np.arange(cfNum)
+    positions = np.zeros((numIterations + 1, cfNum, 2))
+    poses = np.zeros((numIterations + 1, cfNum))
+    positions[0] = fleet.positions
+    poses[0] = fleet.poses
+    # 每架无人机已完成的轮数和各轮的求解结果，没有维诺单元的轮次结果为None
+    done = np.zeros(cfNum, dtype=int)
+    plans = [[] for _ in range(cfNum)]
+    # 正在求解的任务，future到(行号, 轮次, 任务, 截止时刻)；等待某架无人机完成当前轮的无人机行号；
+    # 每架等待中的无人机还需等待的无人机行号
+    running = {}
+    waiting = {}
+    blockedBy = {}
+    emitted = 0
+    # 每轮真实位置和虚拟位置最多移动的距离，虚拟位置还随朝向转动，另加保留两位小数的误差
+    reach = lineSpeed * T
+    virtualReach = reach + lineSpeed / angularSpeed * min(2., angularSpeed * T) + 0.01
+
+    # 第epoch轮开始时的状态，没有完成前面各轮的无人机使用最新状态
+    def snapshot(epoch):
+        steps = np.minimum(done, epoch)
+        state = fleet.copy(positions[steps, allRows])
+        state.poses = poses[steps, allRows]
+        return state
+
+    # 保存一架无人机一轮的结果，返回需要重新检查的无人机：它自己和不再需要等待其他无人机的无人机
+    def commit(row, epoch, info):
+        plans[row].append(info)
+        done[row] += 1
+        if info is not None:
+            fleet.update(info["Id"], info['newPosition'], info['newPose'])
+            for kind in [info['stats'].get('fallback'), 'late' if info['stats'].get('late') else None]:
+                if kind is not None:
+                    fallbacks[kind] = fallbacks.get(kind, 0) + 1
+            draw and graph.updateTrack(info['track'], info["Id"])
+        positions[epoch + 1, row] = fleet.positions[row]
+        poses[epoch + 1, row] = fleet.poses[row]
+        released = []
+        for waiter in sorted(waiting.pop(row, set())):
+            # 仍落后于等待者所在轮时继续等待；等待的无人机都追上后再重新划分检查
+            if done[row] < done[waiter]:
+                waiting.setdefault(row, set()).add(waiter)
+                continue
+            blockedBy[waiter].discard(row)
+            if len(blockedBy[waiter]) == 0:
+                released.append(waiter)
+        return [row] + released
+
+    # 落后的无人机中，追上之前可能影响维诺单元的无人机行号；单元内的点到本无人机的距离不超过radius，
+    # 只有距离小于2*radius的点的中垂线可能穿过单元
+    def nearby(cell, towers, row, lagging, lags, step):
+        radius = np.linalg.norm(np.array(cell) - towers[row], axis=1).max()
+        distance = np.linalg.norm(towers[lagging] - towers[row], axis=1)
+        return lagging[distance - lags * step < 2 * radius]
+
+    # 检查候选无人机，没有需要等待的无人机时立即提交下一轮的求解任务；只计算候选无人机自己的真实和虚拟维诺单元
+    def dispatch(candidates):
+        busy = set(item[0] for item in running.values())
+        candidates = [row for row in set(candidates) if row not in busy and done[row] < numIterations]
+        while len(candidates) > 0:
+            epoch = min(done[row] for row in candidates)
+            group = [row for row in candidates if done[row] == epoch]
+            candidates = [row for row in candidates if done[row] != epoch]
+
+            state = snapshot(epoch)
+            virtualState = vor.virtualPosition(state)
+            groupIds = [fleet.IdList[row] for row in group]
+            vorById = {flie['Id']: flie for flie in vor.localVor(state, groupIds)}
+            virtualResult = vor.localVor(virtualState, groupIds)
+            virtualById = {flie['Id']: flie for flie in virtualResult}
+            lagging = np.where(done < epoch)[0]
+            lags = epoch - done[lagging]
+
+            for row in sorted(group):
+                Id = fleet.IdList[row]
+                if Id not in vorById or Id not in virtualById:
+                    blockers = set(lagging)
+                else:
+                    neighbors = vorById[Id]['neighbors'] | virtualById[Id]['neighbors']
+                    blockers = set(fleet.row(neighbor) for neighbor in neighbors if done[fleet.row(neighbor)] < epoch)
+                    blockers |= set(nearby(vorById[Id]['vertices'], state.positions, row, lagging, lags, reach))
+                    blockers |= set(nearby(virtualById[Id]['vertices'], virtualState.positions, row, lagging, lags, virtualReach))
+                for blocker in blockers:
+                    waiting.setdefault(blocker, set()).add(row)
+                if len(blockers) > 0:
+                    blockedBy[row] = blockers
+                    continue
+                # 没有维诺单元的无人机本轮不动，直接完成
+                if Id not in vorById:
+                    candidates += [item for item in commit(row, epoch, None) if item not in busy and done[item] < numIterations]
+                    continue
+                [message] = makeTasks([vorById[Id]], virtualResult, state)
+                # 每个任务从提交起最多求解calculTimeOut，到时求解进程停止迭代，不占用排在后面的任务
+                deadline = time.time() + calculTimeOut
+                running[solverPool.submit(vorProcess, message, deadline=deadline)] = (row, epoch, message, deadline)
+                busy.add(row)
+            candidates = list(set(candidates))
+
+    print("start calculating!")
+
+    candidates = list(allRows)
+    while True:
+        dispatch(candidates)
+        candidates = []
+
+        # 所有无人机完成某轮规划后输出该轮航点，顺序与同步规划相同
+        while emitted < numIterations and done.min() > emitted:
+            print("epoch: {}, progress: {}%".format(
+                emitted,
+                round(float(emitted)/numIterations * 100, 2)
+            ))
+            state = snapshot(emitted)
+            vorResult = vor.updateVor(state)
+            waypoints = []
+            solveStats = []
+            for flie in vorResult:
+                info = plans[state.row(flie['Id'])][emitted]
+                if info is not None:
+                    waypoints += info['waypoints']
+                    solveStats.append(info['stats'])
+            print("solve iterations: {}, solve time: {}s".format(
+                round(np.mean([item['iter'] for item in solveStats]), 2),
+                round(np.mean([item['time'] for item in solveStats]), 4)
+            ))
+
+            # 根据时间索引进行排序
+            waypoints = sorted(waypoints, key = lambda i: i['index'])
+            allWaypoints.append(waypoints)
+            if handoff is not None:
+                handoff.put((time.time(), waypoints))
+
+            # 更新维诺质心和虚拟位置的维诺边界
+            draw and graph.updateCentroid(np.array([cf['centroid'] for cf in vorResult]))
+            draw and graph.updateRidges(vor.virtualVor(state))
+            emitted += 1
+
+        if len(running) == 0:
+            break
+
+        # 等待到有任务完成或最早的截止时刻，超时、出错或开始时已超时的无人机使用后备轨迹
+        firstDeadline = min(item[3] for item in running.values())
+        wait(list(running), timeout=max(0., firstDeadline - time.time()), return_when=FIRST_COMPLETED)
+        for future in list(running):
+            row, epoch, message, deadline = running[future]
+            if not future.done() and time.time() < deadline:
+                continue
+            running.pop(future)
+            info = None
+            if future.done():
+                info = future.result() if future.exception() is None else None
+            else:
+                future.cancel()
+            if info is None:
+                info = lateProcess(cassingle, message)
+            candidates += commit(row, epoch, info)
+
+    print("consume: {}s to go through casadi".format(time.clock() - start))
+    print("fallbacks: {}".format(fallbacks))
+
+    solverPool.shutdown()
+
+    print("all children process closed.")
+
+    return allWaypoints
+
+# 边规划边飞行，第k+1轮从第k轮规划的终点状态开始规划，与第k轮的飞行同时进行，返回所有轮的航点
+def pipelineFlight(cfController):
+    handoff = RingBuffer(pipelineDepth)
+    planned = []
+
+    # 规划线程无论正常结束还是出错都关闭缓冲区，飞控取完剩余航点后降落
+    def planning():
+        try:
+            planned.extend((getWaypointAsync if asynchronous else getWaypoint)(handoff))
+        finally:
+            handoff.close()
+
+    missionStart = time.time()
+    planner = threading.Thread(target=planning)
+    planner.daemon = True
+    planner.start()
+    cfController.startFlies()
+
+    # 每轮的需要时刻为起飞完成或上一轮飞完的时刻，与规划完成时刻之差为余量，为负时飞行等待了规划
+    slacks = []
+    flightTime = 0.
+    while True:
+        neededBy = time.time()
+        item = handoff.get()
+        if item is None:
+            break
+        readyTime, waypoints = item
+        slacks.append(neededBy - readyTime)
+
+        flightStart = time.time()
+        cfController.goWaypoints(waypoints)
+        flightTime += time.time() - flightStart
+
+    planner.join()
+    print("mission: {}s, flight: {}s".format(round(time.time() - missionStart, 3), round(flightTime, 3)))
+    if len(slacks) > 0:
+        slacks = np.array(slacks)
+        stalls = slacks[slacks < 0]
+        print("plan slack: mean {}s, min {}s; flight stalled {}/{} epochs, {}s in total".format(
+            round(slacks.mean(), 3), round(slacks.min(), 3), len(stalls), len(slacks), round(-stalls.sum(), 3)))
+    return planned
+
 if __name__ == "__main__":
     allWaypoints = []
 
+    if pipeline:
+        cfController = CFController(fleet, N, T, Z, lineSpeed)
+        allWaypoints = pipelineFlight(cfController)
+        cfController.goLand()
     # --load从本地文件直接读取路径结果
-    if args.load:
+    elif args.load:
         f = open("record.txt", "rb")
         allWaypoints = pickle.load(f)
         f.close()
+    elif asynchronous:
+        allWaypoints = getWaypointAsync()
     else:
         allWaypoints = getWaypoint()
 
@@ -230,8 +537,8 @@ if __name__ == "__main__":
         pickle.dump(allWaypoints, f)
         f.close()
 
-    if not args.local:
-        cfController = CFController(allCrazyFlies, N, T, Z, lineSpeed)
+    if not args.local and not pipeline:
+        cfController = CFController(fleet, N, T, Z, lineSpeed)
         print("casadi down, execute all waypoints")
 
         cfController.startFlies()
@@ -17,12 +17,16 @@ from algorithms.cassingle_coverage.CFController import CFController
 from algorithms.cassingle_coverage.borderdVoronoi import Vor
 from algorithms.cassingle_coverage.cassingle import Cassingle
 from algorithms.cassingle_coverage.graphController import Graph
+from algorithms.cassingle_coverage.ringBuffer import RingBuffer
+from algorithms.fleetState import FleetState
 
 # 读取无人机位置配置
 with open("online_simulation/crazyfiles.yaml", "r") as f:
     data = yaml.load(f, Loader=yaml.FullLoader)
 
 allCrazyFlies = data['files']
+# 位置和朝向按行保存，Id到行号的映射只建立一次
+fleet = FleetState(allCrazyFlies)
 
 STOP = False
 numIterations = 30
@@ -36,54 +40,58 @@ N = 6
 Z = 0.5
 draw = False # 是否画图
 allcfsTime = T/N
+volume = 0.05
 actualSpeed = 0.05
 
-allWaypoints = []
+# 规划线程最多领先飞控线程3轮
+waypointBuffer = RingBuffer(3)
 allLoss = []
-# thread2 alive?
-status = 1
 
 def calcul(numIterations):
-    global status
     vor = Vor(box, lineSpeed, angularSpeed)
 
-    cassingle = Cassingle(lineSpeed, angularSpeed, T, N, xRange, yRange)
+    cassingle = Cassingle(lineSpeed, angularSpeed, T, N, xRange, yRange, volume, method="objective")
     
     if(draw):
-        graph = Graph([str(cf['Id']) for cf in allCrazyFlies], xRange, yRange)
+        graph = Graph([str(Id) for Id in fleet.IdList], xRange, yRange)
 
     for counter in range(numIterations):
         print("epoch: {}, progress: {}%".format(
             counter,
             round(float(counter)/numIterations * 100, 2)
         ))
-        # 更新维诺划分
-        vorResult = vor.updateVor(allCrazyFlies)
+        # 更新维诺划分，下面过程中需要真实的和虚拟的位置
+        vorResult = vor.updateVor(fleet)
+        virtualResult = vor.virtualVor(fleet)
+        virtualById = {virtual['Id']: virtual for virtual in virtualResult}
 
         waypoints = []
 
         for flie in vorResult:
-            # 找出对应Id储存在allcrazyfiles中的索引
-            [matchIndex] =  [index for (index, item) in enumerate(allCrazyFlies) if item['Id'] == flie['Id']]
+            # Id对应的行号
+            row = fleet.row(flie['Id'])
+            # 虚拟位置在场地外时没有虚拟维诺单元，目标函数改用真实位置的维诺单元
+            virtualFlie = virtualById.get(flie['Id'], flie)
             # casadi运算下一步位置
             outPut = cassingle.update(
                 flie['vertices'], 
                 flie['centroid'], 
-                allCrazyFlies[matchIndex]['Position'],
-                allCrazyFlies[matchIndex]['Pose']
+                virtualFlie['vertices'],
+                fleet.positions[row],
+                fleet.poses[row],
+                flie['Id']
             )
 
-            allCrazyFlies[matchIndex]['Position'] = [pos for pos in outPut[-1][0:2]]
-            allCrazyFlies[matchIndex]['Pose'] = round(outPut[-1][-1], 2)
+            fleet.update(flie['Id'], outPut[-1][0:2], round(outPut[-1][-1], 2))
             
             draw and graph.updateTrack(
                 np.array(outPut), 
-                allCrazyFlies[matchIndex]['Id']
+                flie['Id']
             )
 
             for timeIndex, item in enumerate(outPut):
                 waypoints.append({
-                    'Id': allCrazyFlies[matchIndex]['Id'],
+                    'Id': flie['Id'],
                     'Px': item[0],
                     'Py': item[1],
                     'theta': item[2],
@@ -93,7 +101,8 @@ def calcul(numIterations):
         # 根据时间索引进行排序
         waypoints = sorted(waypoints, key = lambda i: i['index'])
 
-        allWaypoints.append(waypoints)
+        # 缓冲区满时阻塞，等待飞控线程取出
+        waypointBuffer.put(waypoints)
 
         # 更新维诺质心
         draw and graph.updateCentroid(
@@ -101,43 +110,42 @@ def calcul(numIterations):
         )
         
         # 使用虚拟位置更新维诺边界
-        virtualResult = vor.virtualVor(allCrazyFlies)
         draw and graph.updateRidges(virtualResult)
 
 
         # 计算loss
-        virtualPosition = vor.virtualPosition(allCrazyFlies)
-        loss = cassingle.loss(np.array(
-            [cf['Position'] for cf in virtualPosition]
-        ))
+        loss = cassingle.loss(fleet.virtualPositions(lineSpeed, angularSpeed))
         
         # 储存
         allLoss.append(loss)
-        while len(allWaypoints) > 3:
-            time.sleep(0.1)
     print('calcul done')
-    status = 0
+
+# 规划线程无论正常结束还是出错都关闭缓冲区，飞控线程取完剩余航点后降落
+def planning(numIterations):
+    try:
+        calcul(numIterations)
+    finally:
+        waypointBuffer.close()
 
 if __name__ == "__main__":
     # 时间统计
     start = datetime.datetime.now()
 
     # 创建飞控实例
-    cfController = CFController(allCrazyFlies, N, T, Z, actualSpeed)
+    cfController = CFController(fleet, N, T, Z, actualSpeed)
 
     # 创建副线程并启动
-    thread2 = threading.Thread(target=calcul, args=(numIterations,))
+    thread2 = threading.Thread(target=planning, args=(numIterations,))
     thread2.start()
 
     # 开飞🎉
     cfController.startFlies()
-    # 查看无人机状态
-    while status or len(allWaypoints) > 0:
-        # 从缓冲区取数据
-        if(len(allWaypoints) > 0):
-            cfController.goWaypoints(allWaypoints.pop(0))
-        else:
-            time.sleep(0.1)
+    # 从缓冲区取数据，规划线程结束且取完后返回None
+    while True:
+        waypoints = waypointBuffer.get()
+        if waypoints is None:
+            break
+        cfController.goWaypoints(waypoints)
     
     cfController.goLand()
 
@@ -39,9 +39,15 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--local", help="Run using local simulation.", action="store_true")
 parser.add_argument("--record", help="save the waypoints.", action="store_true")
 parser.add_argument("--load", help="load waypoints from record.", action="store_true")
+parser.add_argument("--headless", help="run the whole simulation in-process and save the history.", action="store_true")
+parser.add_argument("--shared", help="stream the history through shared memory.", action="store_true")
 args = parser.parse_args()
 
-if not args.local:
+# 共享内存中只有位置、角度和速度，真机飞行需要的坠落信息仍通过队列发布
+if args.shared and not args.local:
+    parser.error("--shared only works with --local")
+
+if not args.local and not args.headless:
     # 无人机接口
     from pycrazyswarm import *
 
@@ -55,6 +61,15 @@ allCrazyFlies = data['files']
 STOP = False
 
 if __name__ == '__main__':
+    # --headless, 在当前进程中直接运行完整个仿真，不经过队列，历史数据保存到connect.npz
+    if args.headless:
+        start = time.time()
+        process = Workers('Process1', None, allCrazyFlies, dt, verbose=False)
+        process.run()
+        process.save("connect.npz")
+        print("consume: {}s, history saved to connect.npz".format(time.time() - start))
+        sys.exit(0)
+
     allWaypoints = []
 
     # --load从本地文件直接读取路径结果
@@ -65,7 +80,7 @@ if __name__ == '__main__':
     else:
         # allWaypoints = getWaypoint()
         resultStorage = Queue()
-        process = Workers('Process1', resultStorage, allCrazyFlies, dt)
+        process = Workers('Process1', resultStorage, allCrazyFlies, dt, shared=args.shared)
         # 将进程设置为守护进程，当主程序结束时，守护进程会被强行终止
         process.daemon = True
         process.start()
@@ -110,31 +125,49 @@ if __name__ == '__main__':
 
         plt.show()
         count = 0
-        
+
+        # 获取了所有无人机的位置信息，进行图像更新
+        def updateFigure(epoch):
+            agentHandle.set_offsets(positions)
+            plt.setp(titleHandle, text = "UAVs track epoch "+str(epoch))
+
+            for idx, angle in enumerate(angles):
+                if angle < angleEnd and angle > angleStart:
+                    path = [
+                        [circleX + r * np.cos(angle - cov/2), circleY + r * np.sin(angle - cov/2)],
+                        [circleX + r * np.cos(angle + cov/2), circleY + r * np.sin(angle + cov/2)],
+                        [circleX, circleY]
+                    ]
+                    plt.setp(verHandle[idx], xy=path)
+            plt.pause(0.000000000001)
+
+        if args.shared:
+            # 队列中只有可读取的时刻范围，数据直接从共享内存中按时刻取出
+            while True:
+                chunk = resultStorage.get()
+                if chunk is None:
+                    break
+                for column in range(*chunk):
+                    positions[:, 0] = process.Px_h[:, column]
+                    positions[:, 1] = process.Py_h[:, column]
+                    angles[:] = process.Angle_h[:, column]
+                    epoch += 1
+                    updateFigure(epoch)
+            process.join()
+            process.release()
+
         # 初始化位置信息
-        while not resultStorage.empty():
+        while not args.shared and not resultStorage.empty():
             waypoint = resultStorage.get()
             positions[count, 0] = waypoint['Px']
             positions[count, 1] = waypoint['Py']
             angles[count] = waypoint['theta']
             count += 1
 
-            # 获取了所有无人机的位置信息，进行图像更新
             if count == n:
                 epoch += 1
                 count = 0
-                agentHandle.set_offsets(positions)
-                plt.setp(titleHandle, text = "UAVs track epoch "+str(epoch))
-
-                for idx, angle in enumerate(angles):
-                    if angle < angleEnd and angle > angleStart:
-                        path = [
-                            [circleX + r * np.cos(angle - cov/2), circleY + r * np.sin(angle - cov/2)],
-                            [circleX + r * np.cos(angle + cov/2), circleY + r * np.sin(angle + cov/2)],
-                            [circleX, circleY]
-                        ]
-                        plt.setp(verHandle[idx], xy=path)
-                plt.pause(0.000000000001)
+                updateFigure(epoch)
         plt.ioff()
         plt.show()
 
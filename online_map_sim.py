@@ -7,7 +7,7 @@ import numpy as np
 import time
 import math
 from algorithms.cassingle_coverage.mapConvert import LocateMap
-from multiprocessing import Process, Queue
+import multiprocessing
 
 # if python3
 time.clock = time.time
@@ -21,12 +21,16 @@ sys.path.append(parentUrl)
 from algorithms.cassingle_coverage.borderdVoronoi import Vor
 from algorithms.cassingle_coverage.cassingle import Cassingle
 from algorithms.cassingle_coverage.graphController import Graph
+from algorithms.cassingle_coverage.solverPool import SolverPool, packTask, unpackTask
+from algorithms.fleetState import FleetState
 
 # 读取无人机位置配置
 # with open("online_simulation/crazyfiles.yaml", "r") as f:
 with open("crazyfiles.yaml", "r") as f:
     data = yaml.load(f, Loader=yaml.FullLoader)
 allCrazyFlies = data['files']
+# 位置和朝向按行保存，Id到行号的映射只建立一次
+fleet = FleetState(allCrazyFlies)
 
 # 实验参数
 STOP = False
@@ -42,82 +46,61 @@ N = 10
 allcfsTime = T/N
 volume = 0.05
 Z = 1.0 # 高度
-processNum = len(allCrazyFlies) # 进程数，默认和无人机个数相同
-calculTimeOut = 30 # 每轮运算超时设定
+processNum = multiprocessing.cpu_count() # 进程数，默认和CPU核数相同
+calculTimeOut = 30 # 每轮规划的超时设定，超时的无人机使用后备轨迹
 
 # 取石人公园和中医大省医院为范围
 latRange = (30.681858,  30.672805)
 lngRange = (104.036209, 104.047042)
 
-class workers(Process):
-    def __init__(self, q, name, res):
-        Process.__init__(self)
-        self.q = q
-        self.res = res
-        self.name = name
-
-    def run(self):
-        print(self.name+" started!")
-        while True:
-            if not self.q.empty():
-                try:
-                    flie, virtualResult, cassingle, allCrazyFlies = self.q.get(False)
-                    self.res.put(vorProcess(flie, virtualResult, cassingle, allCrazyFlies))
-                except Exception as e:
-                    pass
-
-def multiProcess(taskPool, resultStorage):
-    # 进程名称
-    casadiLists = ["Process"+str(i) for i in range(1, 1+processNum)]
-    # 储存列表
-    processList = []
-
-    for processName in casadiLists:
-        # 创建新进程，传递输入和输出列表
-        process = workers(taskPool, processName, resultStorage)
-        # 将进程设置为守护进程，当主程序结束时，守护进程会被强行终止
-        process.daemon = True
-        process.start()
-        processList.append(process)
-
-    return processList
-
-def vorProcess(flie, virtualResult, cassingle, allCrazyFlies):
-    waypoints = []
-    # 找出对应Id储存在allcrazyfiles中的索引
-    [matchIndex] =  [index for (index, item) in enumerate(allCrazyFlies) if item['Id'] == flie['Id']]
-
-    # 找到对应Id的虚拟维诺划分
-    virtualFlie = [virtual for virtual in virtualResult if virtual['Id'] == flie['Id']][0]
+# 生成本轮的求解任务，每个任务只携带对应无人机的数据
+def makeTasks(vorResult, virtualResult, fleet):
+    tasks = []
+    virtualById = {virtual['Id']: virtual for virtual in virtualResult}
+    for flie in vorResult:
+        row = fleet.row(flie['Id'])
+        # 虚拟位置在场地外时没有虚拟维诺单元，目标函数改用真实位置的维诺单元
+        virtualFlie = virtualById.get(flie['Id'], flie)
+        tasks.append(packTask(
+            flie['Id'],
+            flie['vertices'],
+            virtualFlie['vertices'],
+            flie['centroid'],
+            fleet.positions[row],
+            fleet.poses[row]
+        ))
+    return tasks
+
+def vorProcess(cassingle, message):
+    Id, vertices, virtualVertices, centroid, position, pose = unpackTask(message)
 
     # casadi运算下一步位置
-    outPut = cassingle.update(
-        flie['vertices'],
-        flie['centroid'],
-        virtualFlie['vertices'],
-        allCrazyFlies[matchIndex]['Position'],
-        allCrazyFlies[matchIndex]['Pose']
-    )
+    outPut = cassingle.update(vertices, centroid, virtualVertices, position, pose, Id)
+
+    return packResult(Id, outPut, cassingle)
+
+# 求解任务没有按时返回，在主进程中直接使用后备轨迹
+def lateProcess(cassingle, message):
+    Id, vertices, virtualVertices, centroid, position, pose = unpackTask(message)
+
+    outPut = cassingle.fallback(vertices, centroid, virtualVertices, position, pose, Id)
 
+    info = packResult(Id, outPut, cassingle)
+    info['stats']['late'] = True
+    return info
+
+# 整理单架无人机的求解结果
+def packResult(Id, outPut, cassingle):
     # 待更新的位置信息
     newPosition = [pos for pos in outPut[-1][0:2]]
     newPose = round(outPut[-1][-1], 2)
 
-    for timeIndex, item in enumerate(outPut):
-        waypoints.append({
-            'Id': allCrazyFlies[matchIndex]['Id'],
-            'Px': item[0],
-            'Py': item[1],
-            'theta': item[2],
-            'index': timeIndex
-        })
-
     info = {
         "track": np.array(outPut),
-        "Id": allCrazyFlies[matchIndex]['Id'],
+        "Id": Id,
         "newPosition": newPosition,
         "newPose": newPose,
-        "waypoints": waypoints
+        "stats": dict(cassingle.solveStats[Id])
     }
 
     return info
@@ -134,15 +117,14 @@ def getWaypoint():
     locateMap = LocateMap(xRange, yRange, lngRange, latRange)
 
     if draw:
-        graph = Graph([str(cf['Id']) for cf in allCrazyFlies], xRange, yRange)
+        graph = Graph([str(Id) for Id in fleet.IdList], xRange, yRange)
 
     allWaypoints = []
 
-    taskPool = Queue() # 根据参数创建队列
-
-    resultStorage = Queue() # 储存进程运算结果的队列
+    solverPool = SolverPool(cassingle, processNum)
 
-    processList = multiProcess(taskPool, resultStorage)
+    # 后备轨迹的使用次数，late为没有按时返回的求解任务
+    fallbacks = {}
 
     print("start calculating!")
 
@@ -153,33 +135,22 @@ def getWaypoint():
         ))
 
         # 更新维诺划分，下面过程中需要真实的和虚拟的位置
-        vorResult = vor.updateVor(allCrazyFlies)
-        virtualResult = vor.virtualVor(allCrazyFlies)
-
-        # 将任务发布到队列中，等待守护进程进行处理
-        for flie in vorResult:
-            taskPool.put((flie, virtualResult, cassingle, allCrazyFlies))
-
-        calculTime = time.clock()
+        vorResult = vor.updateVor(fleet)
+        virtualResult = vor.virtualVor(fleet)
 
-        # 等待所有的任务执行完毕
-        while True:
-            # 超时，程序退出
-            if time.clock() - calculTime > calculTimeOut:
-                print("flies out of range, program exit!")
-                sys.exit(0)
-
-            if resultStorage.qsize() == len(allCrazyFlies):
-                break
+        # 将任务发布到进程池中，等待到本轮超时，没有按时返回的无人机使用后备轨迹
+        tasks = makeTasks(vorResult, virtualResult, fleet)
+        results = solverPool.mapUntil(vorProcess, [(message,) for message in tasks], time.time() + calculTimeOut)
+        results = [info if info is not None else lateProcess(cassingle, message)
+            for info, message in zip(results, tasks)]
 
         waypoints = []
+        solveStats = []
 
         # 将进程结果取出绘画出来
-        while not resultStorage.empty():
-            info = resultStorage.get()
-            [matchIndex] =  [index for (index, item) in enumerate(allCrazyFlies) if item['Id'] == info["Id"]]
-            allCrazyFlies[matchIndex]['Position'] = info['newPosition']
-            allCrazyFlies[matchIndex]['Pose'] = info['newPose']
+        for info in results:
+            solveStats.append(info['stats'])
+            fleet.update(info["Id"], info['newPosition'], info['newPose'])
             draw and graph.updateTrack(
                     info['track'],
                     info["Id"]
@@ -198,6 +169,21 @@ def getWaypoint():
                     'lat': lat
                 })
 
+        # 统计后备轨迹
+        epochFallbacks = {}
+        for item in solveStats:
+            for kind in [item.get('fallback'), 'late' if item.get('late') else None]:
+                if kind is not None:
+                    epochFallbacks[kind] = epochFallbacks.get(kind, 0) + 1
+                    fallbacks[kind] = fallbacks.get(kind, 0) + 1
+
+        # 输出本轮求解统计
+        print("solve iterations: {}, solve time: {}s, fallbacks: {}".format(
+            round(np.mean([item['iter'] for item in solveStats]), 2),
+            round(np.mean([item['time'] for item in solveStats]), 4),
+            epochFallbacks
+        ))
+
         # 更新维诺质心
         draw and graph.updateCentroid(
             np.array([cf['centroid'] for cf in vorResult]) # 真实位置维诺质心
@@ -209,19 +195,19 @@ def getWaypoint():
         # draw and graph.updateRidges(vorResult)
 
         # 将虚拟边界转换为经纬度
+        virtualById = {virtual['Id']: virtual for virtual in virtualResult}
+        vorById = {flie['Id']: flie for flie in vorResult}
         for flie in waypoints:
-            [matchIndex] = [
-                index for (index, item) in enumerate(virtualResult) if item['Id'] == flie['id']
-            ]
+            virtualFlie = virtualById.get(flie['id'], vorById[flie['id']])
             flie['voronoiDiagram'] = []
             flie['centroid'] = []
-            for vertice in virtualResult[matchIndex]['vertices']:
+            for vertice in virtualFlie['vertices']:
                 lng, lat = locateMap.xy2lnglat(vertice[0], vertice[1])
                 flie['voronoiDiagram'].append({
                     'lng': lng,
                     'lat': lat
                 })
-            centroid = virtualResult[matchIndex]['centroid']
+            centroid = virtualFlie['centroid']
             lng, lat = locateMap.xy2lnglat(centroid[0], centroid[1])
             flie['centroid'].append({
                 'lng': lng,
@@ -230,13 +216,11 @@ def getWaypoint():
 
         # 计算loss
         # virtualPosition = vor.virtualPosition(allCrazyFlies)
-        lossList = []
-        for i in range(len(waypoints[0]['points'])):
-            lossList.append(
-                (cassingle.loss(np.array(
-                    [cf['points'][i]['position'][0:2] for cf in waypoints]
-                ))-663)/33.3
-            )
+        # 各时刻的位置一次性计算，形状为(时刻, 无人机, 2)
+        trackPositions = np.array([
+            [point['position'][0:2] for point in cf['points']] for cf in waypoints
+        ]).transpose(1, 0, 2)
+        lossList = ((cassingle.loss(trackPositions) - 663)/33.3).tolist()
 
         waypoints.append({
             "lossFunction": lossList
@@ -245,6 +229,9 @@ def getWaypoint():
         allWaypoints.append(waypoints)
 
     print("consume: {}s to go through casadi".format(time.clock() - start))
+    print("fallbacks: {}".format(fallbacks))
+
+    solverPool.shutdown()
 
     print("all children process closed.")
 
@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 连通保持覆盖参数扫描，结果按列保存到npz文件，中断后重新运行会跳过已完成的参数组
+import sys
+import os
+import yaml
+import argparse
+import numpy as np
+
+# 添加路径
+currentUrl = os.path.dirname(__file__)
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.connect_coverage.sweep import Sweep, gridParams, randomParams
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--random", help="sample this many configurations instead of the full grid.", type=int, default=0)
+parser.add_argument("--seed", help="random seed for --random.", type=int, default=0)
+parser.add_argument("--out", help="columnar results file.", default="sweep.npz")
+parser.add_argument("--process", help="number of processes, defaults to the CPU count.", type=int, default=None)
+parser.add_argument("--threshold", help="sector coverage ratio counted as covered.", type=float, default=0.9)
+args = parser.parse_args()
+
+dt = 0.1 # 控制器更新频率
+
+# 网格扫描的取值
+gridSpace = {
+    "R": [5, 10],
+    "delta": [0.05, 0.1],
+    "epsilon": [0.05, 0.1, 0.2],
+    "vMax": [0.15, 0.2, 0.25],
+    "interval": [4.0, 5.2, 6.5],
+    "brokenIndex": [[], [1, 5]]
+}
+
+# 随机采样的范围，元组为均匀采样区间，列表为候选值
+randomSpace = {
+    "R": (3.0, 12.0),
+    "delta": (0.01, 0.3),
+    "epsilon": (0.02, 0.3),
+    "vMax": (0.1, 0.3),
+    "interval": (3.0, 8.0),
+    "brokenIndex": [[], [1], [1, 5], [1, 5, 9]]
+}
+
+if __name__ == '__main__':
+    with open("crazyfiles.yaml", "r") as f:
+        data = yaml.load(f, Loader=yaml.FullLoader)
+    allCrazyFlies = data['files']
+
+    if args.random > 0:
+        paramList = randomParams(randomSpace, args.random, args.seed)
+    else:
+        paramList = gridParams(gridSpace)
+
+    sweep = Sweep(allCrazyFlies, dt, args.out, args.process, args.threshold)
+    records = sweep.run(paramList)
+
+    # 输出连通度最好的几组参数
+    best = sorted(
+        [record for record in records if not record["metrics"]["failed"]],
+        key=lambda record: -np.nan_to_num(record["metrics"]["minLambda"], nan=-np.inf)
+    )[:5]
+    for record in best:
+        print(record["params"], record["metrics"])
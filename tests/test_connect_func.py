@@ -0,0 +1,48 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+# 连通保持控制律和覆盖控制律的向量化实现须与逐个智能体循环的原实现结果一致
+import sys
+import os
+import numpy as np
+import pytest
+
+# 添加路径
+currentUrl = os.path.dirname(os.path.abspath(__file__))
+parentUrl = os.path.abspath(os.path.join(currentUrl, os.pardir))
+sys.path.append(parentUrl)
+
+from algorithms.connect_coverage.func import Func
+from devTools.checkConnect import loopConPre, loopCcangle, randomFleet, angleStart, angleEnd
+
+def newFunc(radius, sparse=False):
+    return Func(-2.5, 3.0, angleStart, angleEnd, radius, 0.2, 5/180*np.pi, 0.1, 0.1, sparse=sparse)
+
+@pytest.mark.parametrize("n", [12, 50, 200])
+@pytest.mark.parametrize("radius", [1.0, 10.0])
+@pytest.mark.parametrize("value", [0.05, 0.5])
+def test_con_pre(n, radius, value):
+    np.random.seed(n)
+    func, sparseFunc = newFunc(radius), newFunc(radius, sparse=True)
+    positions, angles = randomFleet(n)
+    L, A, d = func.L_Mat(positions)
+    sparseL, sparseA, sparseD = sparseFunc.L_Mat(positions)
+    featureVec = np.random.randn(n)
+    features = np.ones(n) * value
+
+    expect = loopConPre(func, features, featureVec, positions, d, A)
+    # 原实现逐个标量求平方调用的是pow，与数组平方在个别元素上相差一个末位
+    assert np.allclose(expect, func.con_pre(features, featureVec, positions, d, A), rtol=1e-12, atol=0)
+    assert np.allclose(expect, sparseFunc.con_pre(features, featureVec, positions, sparseD, sparseA), rtol=1e-12, atol=0)
+
+@pytest.mark.parametrize("n", [12, 50, 200])
+@pytest.mark.parametrize("radius", [1.0, 10.0])
+@pytest.mark.parametrize("sparse", [False, True])
+def test_ccangle(n, radius, sparse):
+    np.random.seed(n)
+    func = newFunc(radius, sparse=sparse)
+    positions, angles = randomFleet(n)
+    ueHisY = np.random.uniform(-0.2, 0.2, n)
+    agentAngles = np.random.uniform(-0.5, 0.5, n)
+
+    expect = loopCcangle(func, positions, angles, ueHisY, agentAngles)
+    assert np.array_equal(expect, func.ccangle(positions, angles, ueHisY, agentAngles))